@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# benchmark.py
+# Copyright (c) 2018-2020 Pablo Acosta-Serafini
+# See LICENSE for details
+# pylint: disable=C0111
+
+# Standard library imports
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+###
+# Global variables
+###
+IS_PY3 = sys.hexversion > 0x03000000
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB = os.path.join(PKG_DIR, "bin", "shellcheck_stub.py")
+# Metrics compared against a baseline, and whether higher values are better
+METRICS = {"blocks_per_second": True, "peak_memory_kb": False, "wall_time": False}
+CONF_PY = """\
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+extensions = ["sphinx.ext.autodoc", "shellcheck"]
+master_doc = "index"
+project = "benchmark"
+exclude_patterns = ["_build"]
+"""
+# Code blocks without errors and with errors, respectively; {n} is replaced
+# by the document and block numbers, so that the blocks are all different
+# and each one is linted, unless it is generated as a duplicate
+CLEAN_BLOCKS = [
+    ['$ echo "Hello world {n}"', "Hello world {n}"],
+    ['$ cd "${HOME}/dir_{n}" || exit 1', '$ ls -l "${HOME}/dir_{n}"'],
+    ['$ for fname_{n} in *.txt; do echo "${fname_{n}}"; \\', "  done"],
+]
+ERROR_BLOCKS = [
+    ["$ cd mydir_{n}", "$ echo $myvar_{n}"],
+    ["$ ls $HOME/*_{n}.txt | grep foo"],
+    ['$ if [ $1 == "x_{n}" ]; then echo yes; fi'],
+]
+
+###
+# Functions
+###
+def _block(lines, indent):
+    ret = [indent + ".. code-block:: bash", ""]
+    ret.extend(indent + "    " + line for line in lines)
+    return ret + [""]
+
+
+def _param_changes(params, baseline):
+    """Return names of the parameters of a run that differ from a baseline."""
+    ref_params = baseline.get("params", {})
+    return sorted(
+        key
+        for key in set(params) | set(ref_params)
+        if params.get(key) != ref_params.get(key)
+    )
+
+
+def _params(args):
+    """Return parameters of a run, which have to match those of a baseline."""
+    return {
+        "autodoc": args.autodoc,
+        "blocks": args.blocks,
+        "define": args.define,
+        "docs": args.docs,
+        "duplicates": args.duplicates,
+        "errors": args.errors,
+        "seed": args.seed,
+        "stub": args.stub,
+        "latency": args.latency if args.stub else None,
+    }
+
+
+def _peak_memory_kb():
+    """Return peak resident set size of finished child processes, in KiB."""
+    if resource is None:  # pragma: no cover
+        return None
+    ret = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return ret // 1024 if platform.system() == "Darwin" else ret
+
+
+def _tostr(obj):  # pragma: no cover
+    """Convert to string if necessary."""
+    return obj if isinstance(obj, str) else (obj.decode() if IS_PY3 else obj.encode())
+
+
+def _validate_fraction(value):
+    """Validate number is between 0 and 1."""
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise argparse.ArgumentTypeError("{0} is not between 0 and 1".format(value))
+    return value
+
+
+def _validate_positive(value):
+    """Validate number is a positive integer."""
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError("{0} is not a positive integer".format(value))
+    return value
+
+
+def _write(fname, lines):
+    with open(fname, "w") as fobj:
+        fobj.write("\n".join(lines) + "\n")
+
+
+def compare(results, baseline, threshold):
+    """
+    Return the metrics that regressed with respect to a baseline.
+
+    Runs with different parameters are not comparable, a ValueError is
+    raised if the run and the baseline parameters differ
+    """
+    diff = _param_changes(results.get("params", {}), baseline)
+    if diff:
+        raise ValueError(
+            "run and baseline parameters differ: {0}".format(", ".join(diff))
+        )
+    ret = []
+    for metric, higher_is_better in sorted(METRICS.items()):
+        value, ref = results.get(metric), baseline.get(metric)
+        if (value is None) or (not ref):
+            continue
+        change = (value - ref) / float(ref)
+        if (-change if higher_is_better else change) > threshold:
+            ret.append((metric, ref, value, change))
+    return ret
+
+
+def generate(sdir, docs, blocks, autodoc, errors, seed=0, duplicates=0.0):
+    """
+    Generate a Sphinx project with shell code blocks.
+
+    :param sdir: Project directory
+    :param docs: Number of documents
+    :param blocks: Number of code blocks per document
+    :param autodoc: Share of the code blocks in autodoc docstrings
+    :param errors: Share of the code blocks with shellcheck errors
+    :param seed: Random number generator seed
+    :param duplicates: Share of the code blocks that are copies of blocks
+                       generated before them
+    """
+    rng = random.Random(seed)
+    _write(os.path.join(sdir, "conf.py"), CONF_PY.split("\n"))
+    toctree = ["Benchmark", "=========", "", ".. toctree::", ""]
+    generated = []
+    for num in range(docs):
+        name = "doc{0}".format(num)
+        toctree.append("   " + name)
+        title = "Document {0}".format(num)
+        doc_lines, mod_lines = [title, "=" * len(title), ""], []
+        for block in range(blocks):
+            if generated and (rng.random() < duplicates):
+                code = rng.choice(generated)
+            else:
+                code = [
+                    line.replace("{n}", "d{0}b{1}".format(num, block))
+                    for line in rng.choice(
+                        ERROR_BLOCKS if rng.random() < errors else CLEAN_BLOCKS
+                    )
+                ]
+                generated.append(code)
+            if rng.random() < autodoc:
+                mod_lines.extend(
+                    ["", "", "def func{0}():".format(block), '    """', "    Func.", ""]
+                )
+                mod_lines.extend(_block(code, "    ") + ['    """', "    return 0"])
+            else:
+                doc_lines.extend(_block(code, ""))
+        if mod_lines:
+            modname = "mod{0}".format(num)
+            _write(
+                os.path.join(sdir, modname + ".py"),
+                ["# " + modname + ".py"] + mod_lines,
+            )
+            doc_lines.extend([".. automodule:: " + modname, "   :members:", ""])
+        _write(os.path.join(sdir, name + ".rst"), doc_lines)
+    _write(os.path.join(sdir, "index.rst"), toctree)
+
+
+def main(argv):
+    """Run benchmark."""
+    args = setup_cli(argv)
+    baseline = None
+    if args.baseline:
+        # Checked before the run, which can take long
+        with open(args.baseline, "r") as fobj:
+            baseline = json.load(fobj)
+        diff = _param_changes(_params(args), baseline)
+        if diff:
+            print(
+                "Baseline not comparable, run and baseline parameters differ: "
+                "{0}".format(", ".join(diff)),
+                file=sys.stderr,
+            )
+            sys.exit(2)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="shellcheck-bench-")
+    sdir, odir = os.path.join(work_dir, "src"), os.path.join(work_dir, "build")
+    for tdir in (sdir, odir):
+        shutil.rmtree(tdir, ignore_errors=True)
+    os.makedirs(sdir)
+    generate(
+        sdir,
+        args.docs,
+        args.blocks,
+        args.autodoc,
+        args.errors,
+        args.seed,
+        args.duplicates,
+    )
+    cmd = [sys.executable, "-m", "sphinx", "-E", "-a", "-q", "-b", "shellcheck"]
+    cmd += ["-D", "shellcheck_cache=0"]
+    if args.stub:
+        # Measure the extension overhead alone, independent of shellcheck;
+        # the wrapper starts the stand-in with the benchmark interpreter and
+        # without site packages, to keep its start-up time to a minimum
+        exe = os.path.join(work_dir, "shellcheck")
+        _write(
+            exe, ["#!/bin/sh", 'exec "{0}" -S "{1}" "$@"'.format(sys.executable, STUB)]
+        )
+        os.chmod(exe, 0o755)
+        cmd += ["-D", "shellcheck_executable=" + exe]
+    for item in args.define:
+        cmd += ["-D", item]
+    cmd += [sdir, odir]
+    env = dict(os.environ)
+    env["SHELLCHECK_STUB_LATENCY"] = str(args.latency)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(PKG_DIR, "sphinxcontrib")]
+        + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    _, stderr = proc.communicate()
+    wall_time = time.perf_counter() - start
+    if proc.returncode not in (0, 1):
+        print(_tostr(stderr), file=sys.stderr)
+        sys.exit(proc.returncode)
+    with open(os.path.join(odir, "shellcheck_stats.json"), "r") as fobj:
+        stats = json.load(fobj)
+    with open(os.path.join(odir, "output.txt"), "r") as fobj:
+        errors = sum(1 for line in fobj if ": Line " in line)
+    results = {
+        "blocks": len(stats["blocks"]),
+        "blocks_per_second": len(stats["blocks"]) / wall_time,
+        "errors": errors,
+        "params": _params(args),
+        "peak_memory_kb": _peak_memory_kb(),
+        "processes": stats["processes"],
+        "python": platform.python_version(),
+        "times": stats["times"],
+        "wall_time": wall_time,
+    }
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(
+        "{0} blocks, {1} errors: {2:.2f}s, {3:.1f} blocks/s, {4} KiB peak".format(
+            results["blocks"],
+            results["errors"],
+            results["wall_time"],
+            results["blocks_per_second"],
+            results["peak_memory_kb"],
+        )
+    )
+    if args.output:
+        with open(args.output, "w") as fobj:
+            json.dump(results, fobj, indent=1, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for metric, ref, value, change in regressions:
+            print(
+                "Regression: {0} {1:.4g} -> {2:.4g} ({3:+.1%})".format(
+                    metric, ref, value, change
+                )
+            )
+        if regressions:
+            sys.exit(1)
+
+
+def setup_cli(argv):
+    """Implement CLI."""
+    parser = argparse.ArgumentParser(
+        "Benchmark shellcheck builder on a generated Sphinx project"
+    )
+    parser.add_argument(
+        "-n",
+        "--docs",
+        help="specify number of documents (default: 100)",
+        type=_validate_positive,
+        default=100,
+    )
+    parser.add_argument(
+        "-m",
+        "--blocks",
+        help="specify number of code blocks per document (default: 10)",
+        type=_validate_positive,
+        default=10,
+    )
+    parser.add_argument(
+        "-a",
+        "--autodoc",
+        help="specify share of code blocks in autodoc docstrings (default: 0.2)",
+        type=_validate_fraction,
+        default=0.2,
+    )
+    parser.add_argument(
+        "-e",
+        "--errors",
+        help="specify share of code blocks with errors (default: 0.1)",
+        type=_validate_fraction,
+        default=0.1,
+    )
+    parser.add_argument(
+        "-d",
+        "--duplicates",
+        help="specify share of code blocks that are copies of other blocks "
+        "(default: 0)",
+        type=_validate_fraction,
+        default=0.0,
+    )
+    parser.add_argument(
+        "-s", "--seed", help="specify random seed (default: 0)", type=int, default=0
+    )
+    parser.add_argument(
+        "--stub",
+        help="lint with a stand-in for shellcheck that reports canned findings",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-l",
+        "--latency",
+        help="specify stand-in linter latency in seconds (default: 0)",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "-D",
+        "--define",
+        help="override a configuration value, as in sphinx-build",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "-w",
+        "--work-dir",
+        help="specify directory of generated project, kept after the run",
+    )
+    parser.add_argument("-o", "--output", help="specify results JSON file")
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        help="specify baseline results JSON file to compare to, of a run with "
+        "the same parameters",
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        help="specify regression threshold (default: 0.1, i.e. 10%%)",
+        type=float,
+        default=0.1,
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
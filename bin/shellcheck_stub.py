@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# shellcheck_stub.py
+# Copyright (c) 2018-2020 Pablo Acosta-Serafini
+# See LICENSE for details
+# pylint: disable=C0111
+"""
+Stand-in for shellcheck that reports canned findings.
+
+It supports the shellcheck command-line options the extension uses
+(--version, --shell, --color, --format=json and --format=json1, with "-"
+reading a script from standard input), so that it can be selected via the
+shellcheck_executable configuration variable to measure the extension
+overhead independently of shellcheck. It is configured via environment
+variables:
+
+* SHELLCHECK_STUB_LATENCY: seconds to wait before reporting findings,
+  default 0
+
+* SHELLCHECK_STUB_PATTERN: regular expression, one finding is reported for
+  each match in a script line, default unquoted variable expansions
+
+* SHELLCHECK_STUB_FINDING: JSON object with the code, level and message of
+  the findings, default those of shellcheck SC2086
+"""
+
+# Standard library imports
+from __future__ import print_function
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+###
+# Global variables
+###
+FINDING = {
+    "code": 2086,
+    "level": "info",
+    "message": "Double quote to prevent globbing and word splitting.",
+}
+PATTERN = r'(?<!")\$\{?\w'
+VERSION = """\
+ShellCheck - shell script analysis tool
+version: 0.7.1
+license: GNU General Public License, version 3
+website: https://www.shellcheck.net"""
+
+
+###
+# Functions
+###
+def findings(fname, lines, pattern, finding):
+    """Return findings of a script."""
+    ret = []
+    for num, line in enumerate(lines, 1):
+        if line.lstrip().startswith("#"):
+            continue
+        for match in pattern.finditer(line):
+            ret.append(
+                dict(
+                    finding,
+                    file=fname,
+                    line=num,
+                    endLine=num,
+                    column=match.start() + 1,
+                    endColumn=match.end() + 1,
+                    fix=None,
+                )
+            )
+    return ret
+
+
+def main(argv):
+    """Lint scripts."""
+    args = setup_cli(argv)
+    if args.version:
+        print(VERSION)
+        return 0
+    if not args.files:
+        print("No files specified.", file=sys.stderr)
+        return 4
+    time.sleep(float(os.environ.get("SHELLCHECK_STUB_LATENCY", "0")))
+    pattern = re.compile(os.environ.get("SHELLCHECK_STUB_PATTERN", PATTERN))
+    finding = dict(
+        FINDING, **json.loads(os.environ.get("SHELLCHECK_STUB_FINDING", "{}"))
+    )
+    ret = []
+    for fname in args.files:
+        if fname == "-":
+            lines = sys.stdin.read().split("\n")
+        else:
+            with open(fname, "r") as fobj:
+                lines = fobj.read().split("\n")
+        ret.extend(findings(fname, lines, pattern, finding))
+    print(json.dumps({"comments": ret} if args.format == "json1" else ret))
+    return 1 if ret else 0
+
+
+def setup_cli(argv):
+    """Implement CLI."""
+    parser = argparse.ArgumentParser("shellcheck_stub.py")
+    parser.add_argument("-V", "--version", action="store_true")
+    parser.add_argument("-s", "--shell")
+    parser.add_argument("-C", "--color", nargs="?")
+    parser.add_argument("-f", "--format", choices=["json", "json1"], default="json")
+    parser.add_argument("files", nargs="*")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
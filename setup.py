@@ -85,6 +85,7 @@ if INSTALL_MODE_IS_TEST:
         (
             os.path.join(SHARE_DIR, "bin"),
             [
+                os.path.join(PWD, "bin", "benchmark.py"),
                 os.path.join(PWD, "bin", "cprint.sh"),
                 os.path.join(PWD, "bin", "coveragerc_manager.py"),
                 os.path.join(PWD, "bin", "fix_windows_symlinks.py"),
@@ -93,6 +94,7 @@ if INSTALL_MODE_IS_TEST:
                 os.path.join(PWD, "bin", "get-pylint-files.sh"),
                 os.path.join(PWD, "bin", "make-pkg.sh"),
                 os.path.join(PWD, "bin", "print-env.sh"),
+                os.path.join(PWD, "bin", "shellcheck_stub.py"),
                 os.path.join(PWD, "bin", "winnorm_path.py"),
             ],
         ),
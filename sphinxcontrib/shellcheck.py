@@ -6,16 +6,35 @@
 
 # Standard library import
 import abc
+import argparse
+import ast
 import codecs
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import heapq
+import io
 import json
+import mmap
 import os
+import pathlib
 import platform
 import re
+import shutil
 import sys
 import subprocess
 import tempfile
 import textwrap
+import threading
+import time
 import types
+import weakref
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
 
 # Literal copy from [...]/site-packages/pip/_vendor/compat.py
 try:
@@ -79,63 +98,283 @@ except ImportError:  # pragma: no cover
 
 # PyPI imports
 import decorator
-import docutils.nodes
+from docutils import nodes
 import sphinx.errors
 import sphinx.util.logging
 from sphinx.builders import Builder
 from sphinx.locale import __
 
+try:
+    from sphinx.util.display import status_iterator
+except ImportError:  # pragma: no cover
+    # Before Sphinx 6.1
+    from sphinx.util import status_iterator
+
 
 ###
 # Global variables
 ###
 LOGGER = sphinx.util.logging.getLogger(__name__)
+# Linter information already found by this process, keyed like the on-disk
+# linter information cache
+LINTERS = {}
+# Version of the format of linting results in the cache
+CACHE_VERSION = 2
+# Version of the shell code blocks records kept in the build environment,
+# environments with other versions are discarded and documents read again
+ENV_VERSION = 1
+# Seconds the linter has to report its version and features
+PROBE_TIMEOUT = 60
+# Shell code blocks collectors of Sphinx applications
+COLLECTORS = weakref.WeakKeyDictionary()
+# Background linters of Sphinx applications building other formats
+LINT_THREADS = weakref.WeakKeyDictionary()
+# Program that sets resource limits, given as a JSON list of (limit,
+# (soft, hard)) items, and executes a linter, where the limits of a started
+# process cannot be set (resource.prlimit is only available on Linux)
+LIMITS_WRAPPER = (
+    "import json, os, resource, sys\n"
+    "for limit, values in json.loads(sys.argv[1]):\n"
+    "    resource.setrlimit(limit, values)\n"
+    "os.execvp(sys.argv[2], sys.argv[2:])\n"
+)
 
 
 ###
 # Functions
 ###
-def _check_version(vmin=(0, 4, 4)):
+def _assign_shards(weights, count):
+    """
+    Assign items to shards so that the shards have about the same total weight.
+
+    Items are taken in order of decreasing weight, then name, and each one is
+    assigned to the shard with the lowest total weight so far, then number,
+    so the assignment only depends on the items and their weights. Return the
+    shard number (zero-based) keyed by item name
+    """
+    heap = [(0, num) for num in range(count)]
+    ret = {}
+    for name, weight in sorted(weights.items(), key=lambda item: (-item[1], item[0])):
+        total, num = heapq.heappop(heap)
+        ret[name] = num
+        heapq.heappush(heap, (total + weight, num))
+    return ret
+
+
+def _changed_files(ref, cwd):
+    """
+    Return files of a git repository that differ from a reference.
+
+    Files are compared to the reference as they are in the working tree,
+    committed or not, and files not tracked by git (but not ignored) count
+    as changed. File names are absolute and normalized with _norm_path
+    """
+    ret = set()
+    top = _git(["rev-parse", "--show-toplevel"], cwd).strip()
+    for args in (
+        ["diff", "--name-only", "-z", ref, "--"],
+        ["ls-files", "--others", "--exclude-standard", "--full-name", "-z"],
+    ):
+        for fname in _git(args, cwd).split("\0"):
+            if fname:
+                ret.add(_norm_path(os.path.join(top, fname)))
+    return ret
+
+
+def _check_version(version, vmin=(0, 4, 4)):
     """
     Verify minimum shellcheck version.
 
     Done without using distutil functions to avoid unnecessary dependencies
     """
-    stdout, _ = subprocess.Popen(
-        ["shellcheck", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    ).communicate()
     ret = False
-    for line in _tostr(stdout).strip().split(os.linesep):  # pragma: no cover
-        line = line.strip()
-        if line.startswith("version:"):
-            version = " ".join(line.split()[1:])
-            tokens = version.split(".")
-            if len(tokens) < 3:  # pragma: no cover
-                break
-            v0 = int(tokens[0])
-            v1 = int(tokens[1])
-            v2 = int(tokens[2])
-            if (
-                (v0 > vmin[0])
-                or ((v0 == vmin[0]) and (v1 > vmin[1]))
-                or ((v0 == vmin[0]) and (v1 == vmin[1]) and (v2 >= vmin[2]))
-            ):  # pragma: no cover
-                ret = True
-            break
+    tokens = version.split(".")
+    if len(tokens) >= 3:  # pragma: no cover
+        v0 = int(tokens[0])
+        v1 = int(tokens[1])
+        v2 = int(tokens[2])
+        if (
+            (v0 > vmin[0])
+            or ((v0 == vmin[0]) and (v1 > vmin[1]))
+            or ((v0 == vmin[0]) and (v1 == vmin[1]) and (v2 >= vmin[2]))
+        ):  # pragma: no cover
+            ret = True
     return ret
 
 
-def _errors(stdout):
-    keys = ("line", "column", "code", "message")
-    stdout = _tostr(stdout).strip()
-    for error in json.loads(_tostr(stdout)):
+def _docstring_line(node):
+    """Return first line of docstring of AST node, None if it has none."""
+    body = getattr(node, "body", None)
+    if (not body) or (not isinstance(body[0], ast.Expr)):
+        return None
+    value = body[0].value
+    text = getattr(value, "value", getattr(value, "s", None))
+    if (type(value).__name__ not in ("Constant", "Str")) or (not isinstance(text, str)):
+        return None
+    if hasattr(value, "end_lineno"):
+        return value.lineno
+    # Before Python 3.8 the line number of a multi-line string is that of
+    # its last line
+    return value.lineno - text.count("\n")  # pragma: no cover
+
+
+def _docstring_lines(data):
+    """Return first line of docstrings of module objects keyed by dotted name."""
+    tree = ast.parse(data)
+    ret = {"": _docstring_line(tree)}
+    stack = [("", tree)]
+    while stack:
+        prefix, node = stack.pop()
+        for child in reversed(list(ast.iter_child_nodes(node))):
+            if isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = prefix + child.name
+                ret[name] = _docstring_line(child)
+                stack.append((name + ".", child))
+            elif isinstance(getattr(child, "body", None), list):
+                # Objects defined in conditional, loop, exception handling,
+                # etc. blocks
+                stack.append((prefix, child))
+    return dict((key, value) for key, value in ret.items() if value is not None)
+
+
+def _errors(stdout, keys=("line", "column", "code", "message")):
+    errors = json.loads(_tostr(stdout))
+    # The json1 format is an object with the findings in its comments member
+    for error in errors["comments"] if isinstance(errors, dict) else errors:
         yield tuple(error[item] for item in keys)
 
 
+def _format_error(line, col, code, desc):
+    return "Line {0}, column {1} [{2}]: {3}".format(line, col, code, desc)
+
+
 def _get_indent(line):
     return len(line) - len(line.lstrip())
 
 
+def _get_linter_info(exe, fname):
+    """
+    Get linter path, version and supported features.
+
+    Probing the linter requires running it several times, so the information
+    is cached in memory and in a file, keyed by the linter path, size and
+    modification time so that it is probed again if the linter changes
+    """
+    path = os.path.abspath(exe)
+    stat = os.stat(os.path.realpath(path))
+    key = "{0}|{1}|{2}".format(path, stat.st_size, stat.st_mtime)
+    if key in LINTERS:
+        return LINTERS[key]
+    cache = {}
+    with ignored(OSError, ValueError):
+        with codecs.open(fname, "r", "utf-8") as fobj:
+            cache = json.load(fobj)
+    if key not in cache:
+        cache[key] = _probe_linter(path)
+        with ignored(OSError):
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            fdesc, tmpname = tempfile.mkstemp(dir=os.path.dirname(fname))
+            with os.fdopen(fdesc, "w", encoding="utf-8") as fobj:
+                json.dump(cache, fobj)
+            os.replace(tmpname, fname)
+    LINTERS[key] = cache[key]
+    return LINTERS[key]
+
+
+def _get_version(exe="shellcheck"):
+    """Get shellcheck version string, empty if it cannot be determined."""
+    stdout = _wait_probe(
+        subprocess.Popen(
+            [exe, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    )
+    for line in _tostr(stdout or b"").strip().split(os.linesep):  # pragma: no cover
+        line = line.strip()
+        if line.startswith("version:"):
+            return " ".join(line.split()[1:])
+    return ""  # pragma: no cover
+
+
+def _git(args, cwd):
+    """Run a git command, return its standard output; raise OSError if it fails."""
+    proc = subprocess.Popen(
+        ["git"] + args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    stdout, stderr = proc.communicate()
+    if proc.returncode:
+        raise OSError(_tostr(stderr).strip())
+    return _tostr(stdout)
+
+
+def _module_name(fname):
+    # Dotted name of the module of a file, its packages are the directories
+    # above it with an __init__.py file
+    dname, base = os.path.split(os.path.abspath(fname))
+    ret = [] if base.startswith("__init__.") else [os.path.splitext(base)[0]]
+    while os.path.isfile(os.path.join(dname, "__init__.py")):
+        dname, package = os.path.split(dname)
+        ret.insert(0, package)
+    return ret
+
+
+def _norm_path(fname):
+    return os.path.normcase(os.path.realpath(fname))
+
+
+def _probe_linter(exe):
+    """Find linter version and the input and output features it supports."""
+    script = "#!/bin/sh\necho\n"
+    ret = {
+        "path": exe,
+        "version": _get_version(exe),
+        "stdin": False,
+        "multiple_files": False,
+        "json1": False,
+    }
+    with ignored(ValueError, TypeError, KeyError):
+        stdout = _run_probe([exe, "--format=json", "-"], script)
+        ret["stdin"] = json.loads(_tostr(stdout)) == []
+    with ignored(ValueError, TypeError, KeyError):
+        stdout = _run_probe([exe, "--format=json1", "-"], script)
+        ret["json1"] = json.loads(_tostr(stdout))["comments"] == []
+    with contextlib.ExitStack() as stack:
+        fnames = [
+            stack.enter_context(
+                TmpFile(script, fpointer=lambda x, y: x.write(y.encode("ascii")))
+            )
+            for _ in range(2)
+        ]
+        with ignored(ValueError, TypeError):
+            stdout = _run_probe([exe, "--format=json"] + fnames)
+            ret["multiple_files"] = json.loads(_tostr(stdout)) == []
+    return ret
+
+
+def _read_shard(sdir):
+    """
+    Return the information of a shard of a sharded lint build.
+
+    It is the shard number, the shard count, the documents of the shard, and
+    whether the shard results were cut off and its time budget exceeded
+    """
+    with codecs.open(os.path.join(sdir, "shard.json"), "r", "utf-8") as fobj:
+        info = json.load(fobj)
+    num, count = info["shard"]
+    return num, count, info["docs"], info["cut_off"], info["over_budget"]
+
+
+def _run_probe(cmd, stdin=None):
+    """Run linter, return its standard output if it succeeds, None otherwise."""
+    try:
+        proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout = _wait_probe(proc, None if stdin is None else stdin.encode("ascii"))
+    except OSError:  # pragma: no cover
+        return None
+    return stdout if proc.returncode == 0 else None
+
+
 def _tostr(line):  # pragma: no cover
     return (
         line
@@ -144,64 +383,856 @@ def _tostr(line):  # pragma: no cover
     )
 
 
+def _wait_probe(proc, stdin=None):
+    """Return linter probe standard output, None if it does not finish in time."""
+    try:
+        stdout, _ = proc.communicate(stdin, timeout=PROBE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        return None
+    return stdout
+
+
+def main(argv):
+    """Merge the results of the shards of a sharded lint build."""
+    parser = argparse.ArgumentParser(
+        "python -m sphinxcontrib.shellcheck",
+        description="Merge the results of the shards of a sharded lint build",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="specify directory of merged output.txt (default: .)",
+        default=".",
+    )
+    parser.add_argument(
+        "shard_dirs", help="output directories of the shards", nargs="+"
+    )
+    args = parser.parse_args(argv)
+    try:
+        return merge_shards(args.output_dir, args.shard_dirs)
+    except (OSError, KeyError, ValueError) as exc:
+        print("Shards could not be merged: {0}".format(exc), file=sys.stderr)
+        return 2
+
+
+def merge_shards(outdir, shard_dirs):
+    """
+    Merge the results of the shards of a sharded lint build.
+
+    The errors of all the documents are written to the output.txt file of
+    the output directory as an unsharded build writes them
+
+    :param outdir: Output directory
+    :param shard_dirs: Output directories of all the shards of the build
+    :returns: Exit status of an unsharded build, 1 if there are errors
+    :raises: OSError if the results of a document are missing, ValueError
+        if the directories are not those of all the shards of a build
+    """
+    docs, nums, counts, cut_off, over_budget = {}, set(), set(), False, False
+    for sdir in shard_dirs:
+        num, count, shard_docs, shard_cut_off, shard_over_budget = _read_shard(sdir)
+        if num in nums:
+            raise ValueError("shard {0} is repeated".format(num))
+        nums.add(num)
+        counts.add(count)
+        cut_off |= shard_cut_off
+        over_budget |= shard_over_budget
+        for docname, doc in shard_docs.items():
+            fname = os.path.join(sdir, "results", docname + ".json")
+            docs[docname] = (doc, fname, shard_cut_off)
+    if (len(counts) != 1) or (nums != set(range(1, counts.pop() + 1))):
+        raise ValueError("shards are not all the shards of a build")
+    tasks = {}
+    for docname in sorted(docs):
+        _, fname, shard_cut_off = docs[docname]
+        tasks[docname] = []
+        # Shards cut off may not have linted all their documents, otherwise
+        # missing results are an error, not a document without errors
+        if shard_cut_off and (not os.path.exists(fname)):
+            continue
+        with codecs.open(fname, "r", "utf-8") as fobj:
+            tasks[docname] = json.load(fobj)["tasks"]
+    # Errors in files included in several documents are reported once, as
+    # in the builder
+    release = {}
+    for docname in sorted(docs):
+        for task in tasks[docname]:
+            release[task["source"]] = docname
+    index, lines, reported = {}, [], 0
+    for docname in sorted(docs):
+        doc = docs[docname][0]
+        for task in tasks[docname]:
+            seen = index.setdefault(task["source"], set())
+            output = []
+            for error in task["errors"]:
+                info = (
+                    error[0] + task["line_offset"],
+                    error[1] + task["col_offset"],
+                    error[2],
+                    error[3],
+                )
+                if info not in seen:
+                    seen.add(info)
+                    output.append(info)
+            if output:
+                lines.append("{0}: {1}".format(doc, task["source"]))
+                lines.extend(
+                    "{0}: {1}".format(doc, _format_error(*info)) for info in output
+                )
+            reported += len(output)
+        for source in [key for key, value in release.items() if value == docname]:
+            index.pop(source, None)
+    if cut_off:
+        msg = "Results cut off after {0} findings".format(reported)
+        lines.append(msg + (", lint time budget exceeded" if over_budget else ""))
+    os.makedirs(outdir, exist_ok=True)
+    with io.open(
+        os.path.join(outdir, "output.txt"), "w", encoding="utf-8", newline=""
+    ) as fobj:
+        fobj.writelines(line + os.linesep for line in lines)
+    return int(bool(reported) or cut_off)
+
+
 ###
 # Classes
 ###
+class BlockCollector(object):
+    """
+    Collect shell code blocks of documents.
+
+    Blocks are collected when documents are read and stored in the build
+    environment as (text, dialect, source file name, line, indent) records
+    """
+
+    def __init__(self, dialects, cachedir, debug=False):  # noqa
+        self._debug = debug
+        self._srcindex = SourceIndex()
+        self._docindex = DocstringIndex(self._srcindex, cachedir)
+        self.dialects = dialects
+        self.source_time = 0.0
+
+    def _debug_log(self, *lines):  # pragma: no cover
+        if self._debug:
+            for line in lines:
+                LOGGER.info(line)
+
+    def _get_block_indent(self, line, source, tabwidth):
+        return _get_indent(self._srcindex.line(source, line + 1, tabwidth))
+
+    def _is_shell_node(self, node):
+        return node.source and (node.get("language", "").lower() in self.dialects)
+
+    def _record(self, node, tabwidth):
+        regexp = re.compile("(.*):docstring of (.*)")
+        text = _tostr(node.astext())
+        dialect = node.attributes.get("language").lower()
+        source, func_abs_name = (
+            regexp.match(node.source).groups()
+            if ":docstring of " in node.source
+            else (node.source, None)
+        )
+        source = os.path.abspath(source.strip())
+        self._debug_log("Analyzing file " + source, "<<< Node code", text, ">>>")
+        line = node.line
+        if func_abs_name:
+            first_line = self._docindex.line(source, func_abs_name)
+            if first_line is None:
+                LOGGER.warning(
+                    __("docstring of %s not found in %s"), func_abs_name, source
+                )
+            else:
+                line = first_line + line
+        indent = self._get_block_indent(line, source, tabwidth)
+        self._debug_log("Indent: " + str(indent))
+        return (text, dialect, source, line, indent)
+
+    def _shell_nodes(self, doctree):
+        # Only literal blocks can be shell code blocks
+        for node in doctree.traverse(nodes.literal_block):
+            if self._is_shell_node(node):
+                yield node
+
+    def close(self):
+        """Release source files."""
+        self._srcindex.close()
+
+    def collect(self, doctree):
+        """
+        Return records of the shell code blocks of a doctree.
+
+        Blocks whose source cannot be read (e.g. docstrings of objects
+        without a module file, or of extension modules) are skipped with a
+        warning, documents are read for all builders
+        """
+        tabwidth = doctree.settings.tab_width
+        ret = []
+        for node in self._shell_nodes(doctree):
+            start = time.perf_counter()
+            try:
+                ret.append(self._record(node, tabwidth))
+            except (IndexError, OSError, SyntaxError, TypeError, ValueError) as exc:
+                LOGGER.warning(
+                    __("shell code block skipped, source not read: %s"),
+                    exc,
+                    location=node,
+                )
+            self.source_time += time.perf_counter() - start
+        return ret
+
+
+class BuildStats(object):
+    """
+    Time the phases of a lint build.
+
+    Durations are accumulated per phase, per document and per code block;
+    linter processes run concurrently, so the sum of their wall times can
+    exceed the build time
+    """
+
+    phases = (
+        "traversal",
+        "source",
+        "script",
+        "cache",
+        "tempfile",
+        "subprocess",
+        "parse",
+        "output",
+    )
+
+    def __init__(self):  # noqa
+        self._start = time.perf_counter()
+        self._write_start = None
+        self.blocks = []
+        self.docs = {}
+        self.duplicates = 0
+        self.failures = 0
+        self.processes = 0
+        self.times = dict((phase, 0.0) for phase in self.phases)
+
+    def add(self, phase, seconds):
+        """Add duration to a phase."""
+        self.times[phase] += seconds
+
+    def add_block(self, task, seconds):
+        """Add linting duration of a code block to its document."""
+        doc = self.docs.setdefault(
+            task.docname, {"blocks": 0, "cached": 0, "time": 0.0}
+        )
+        doc["blocks"] += 1
+        doc["cached"] += int(task.cached)
+        doc["time"] += seconds
+        self.blocks.append(
+            {
+                "doc": task.docname,
+                "source": task.source,
+                "line": task.line_offset,
+                "cached": task.cached,
+                "time": seconds,
+            }
+        )
+
+    def eta(self, done, total):
+        """Return the estimated time left to lint the remaining documents."""
+        if self._write_start is None:
+            self._write_start = time.perf_counter()
+        if not done:
+            return "?"
+        elapsed = time.perf_counter() - self._write_start
+        return "{0:.0f}s".format(elapsed * (total - done) / done)
+
+    def save(self, fname):
+        """Write statistics to a JSON file."""
+        with codecs.open(fname, "w", "utf-8") as fobj:
+            json.dump(
+                {
+                    "blocks": self.blocks,
+                    "docs": self.docs,
+                    "duplicates": self.duplicates,
+                    "failures": self.failures,
+                    "processes": self.processes,
+                    "time": time.perf_counter() - self._start,
+                    "times": self.times,
+                },
+                fobj,
+                indent=1,
+                sort_keys=True,
+            )
+
+    def summary(self, num=5):
+        """Return lines of a summary of the statistics."""
+        ret = [
+            "{0} blocks in {1} documents, {2} duplicates, {3} linter processes, "
+            "{4} failed, {5:.2f}s".format(
+                len(self.blocks),
+                len(self.docs),
+                self.duplicates,
+                self.processes,
+                self.failures,
+                time.perf_counter() - self._start,
+            ),
+            ", ".join(
+                "{0} {1:.2f}s".format(phase, self.times[phase]) for phase in self.phases
+            ),
+        ]
+        slowest = sorted(
+            self.docs.items(), key=lambda item: (-item[1]["time"], item[0])
+        )
+        if slowest:
+            ret.append(
+                "slowest documents: "
+                + ", ".join(
+                    "{0} {1:.2f}s".format(docname, doc["time"])
+                    for docname, doc in slowest[:num]
+                )
+            )
+        return ret
+
+    @contextlib.contextmanager
+    def timer(self, phase):
+        """Time a phase of the build."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[phase] += time.perf_counter() - start
+
+
+class DocstringIndex(object):
+    """
+    Index of first line of docstrings of Python modules objects.
+
+    Modules are parsed, not imported, and the index of each module is saved
+    keyed by a hash of the module contents, so a module is parsed again only
+    if it changes
+    """
+
+    def __init__(self, srcindex, cachedir):  # noqa
+        self._cachedir = cachedir
+        self._modules = {}
+        self._names = {}
+        self._srcindex = srcindex
+
+    def _get(self, fname):
+        mtime = os.path.getmtime(fname)
+        entry = self._modules.get(fname)
+        if entry and (entry[0] == mtime):
+            return entry[1]
+        data = bytes(self._srcindex.data(fname))
+        digest = hashlib.sha256(data).hexdigest()
+        cache_fname = os.path.join(self._cachedir, digest + ".json")
+        try:
+            with codecs.open(cache_fname, "r", "utf-8") as fobj:
+                index = json.load(fobj)
+        except (OSError, ValueError):
+            index = _docstring_lines(data)
+            with ignored(OSError):
+                os.makedirs(self._cachedir, exist_ok=True)
+                fdesc, tmpname = tempfile.mkstemp(dir=self._cachedir)
+                with os.fdopen(fdesc, "w", encoding="utf-8") as fobj:
+                    json.dump(index, fobj)
+                os.replace(tmpname, cache_fname)
+        self._modules[fname] = (mtime, index)
+        return index
+
+    def line(self, fname, name):
+        """
+        Return first line of docstring of an object, None if not found.
+
+        :param fname: Module file name
+        :param name: Object dotted name, including any package and module
+                     names
+        """
+        index = self._get(fname)
+        if fname not in self._names:
+            self._names[fname] = _module_name(fname)
+        module = self._names[fname]
+        tokens = name.split(".")
+        # Package and module names are not part of the indexed names; the
+        # object name starts with the module name, with a part of it when
+        # the module is imported from a package directory, or with the names
+        # of namespace packages before it. The shortest such start is
+        # stripped, the module docstring is indexed with an empty name
+        for num in range(1, len(tokens) + 1):
+            count = min(num, len(module))
+            if tokens[num - count : num] == module[len(module) - count :]:
+                return index.get(".".join(tokens[num:]))
+        return None
+
+
+class FindingsParser(object):
+    """
+    Parse linter JSON output incrementally.
+
+    Findings are decoded one at a time as the linter output is read and
+    grouped by file name; both the json format, an array of findings, and
+    the json1 format, an object with the array of findings in its comments
+    member, are supported
+    """
+
+    def __init__(self, keys=("line", "column", "code", "message", "level")):  # noqa
+        self._buf = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._done = False
+        self._json = json.JSONDecoder()
+        self._started = False
+        self.findings = {}
+        self.keys = keys
+        self.time = 0.0
+
+    def _parse(self):
+        buf, idx = self._buf, 0
+        if not self._started:
+            # The array of findings is the first array of either format
+            idx = buf.find("[")
+            if idx == -1:
+                return
+            self._started, idx = True, idx + 1
+        while not self._done:
+            while (idx < len(buf)) and (buf[idx] in " \t\r\n,"):
+                idx += 1
+            if idx == len(buf):
+                break
+            if buf[idx] == "]":
+                self._done, idx = True, idx + 1
+                break
+            try:
+                item, idx = self._json.raw_decode(buf, idx)
+            except ValueError:
+                # Finding not completely read yet
+                break
+            self.findings.setdefault(item.get("file", "-"), []).append(
+                tuple(item[key] for key in self.keys)
+            )
+        self._buf = buf[idx:]
+
+    def close(self):
+        """Return findings, keyed by file name, once all output was read."""
+        self.feed(b"", True)
+        if not self._done:
+            raise ValueError("Incomplete linter output")
+        return self.findings
+
+    def feed(self, data, final=False):
+        """Parse a chunk of linter output."""
+        start = time.perf_counter()
+        self._buf += self._decoder.decode(data, final)
+        if not self._done:
+            self._parse()
+        self.time += time.perf_counter() - start
+
+
 class InvalidShellcheckBuilderConfig(sphinx.errors.SphinxError):  # noqa: D101
     category = __("ShellcheckBuilder failed")
 
 
+class JsonLinesWriter(object):
+    """Write linting findings to a JSON Lines file, one finding per line."""
+
+    def __init__(self, fname):  # noqa
+        self._fobj = io.open(fname, "w", encoding="utf-8", newline="\n")
+
+    def close(self):
+        """Close output file."""
+        self._fobj.close()
+
+    def write(self, finding):
+        """Write a finding."""
+        self._fobj.write(json.dumps(finding, sort_keys=True))
+        self._fobj.write("\n")
+
+
+class LintEngine(object):
+    """
+    Run linter processes concurrently.
+
+    The processes are run by a pool of jobs threads, so that shell code
+    blocks keep being found and turned into scripts while earlier linter
+    processes run; at most jobs processes run at a time. The processes can
+    be given resource limits, as (resource.RLIMIT_*, value) tuples, so that
+    no single script takes over the build host
+    """
+
+    def __init__(self, jobs, limits=()):  # noqa
+        self._limits = []
+        for limit, value in limits:
+            # A process cannot raise its hard limits
+            hard = resource.getrlimit(limit)[1]
+            value = value if hard == resource.RLIM_INFINITY else min(value, hard)
+            self._limits.append((limit, (value, value)))
+        self._executor = concurrent.futures.ThreadPoolExecutor(jobs)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.chunk_size = 65536
+        self.jobs = jobs
+
+    def _communicate(self, job, cmd, stdin, parser, timeout):
+        start = time.perf_counter()
+        if self._limits and (not hasattr(resource, "prlimit")):  # pragma: no cover
+            wrapper = [sys.executable, "-S", "-c", LIMITS_WRAPPER]
+            cmd = wrapper + [json.dumps(self._limits)] + list(cmd)
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._set_limits(proc)
+        with self._lock:
+            job.proc = proc
+            if job.cancelled:
+                self._kill(proc)
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, self._expire, (job,))
+            timer.daemon = True
+            timer.start()
+        try:
+            output = self._read(proc, stdin, parser)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if job.cancelled:
+            raise concurrent.futures.CancelledError()
+        # Timed out processes have no output
+        output = None if job.expired else output
+        return output, time.perf_counter() - start, proc.returncode
+
+    def _expire(self, job):
+        with self._lock:
+            if job.proc.poll() is None:
+                job.expired = True
+                self._kill(job.proc)
+
+    def _kill(self, proc):
+        with ignored(OSError):
+            proc.kill()
+
+    def _read(self, proc, stdin, parser):
+        if parser is None:
+            stdout, _ = proc.communicate(stdin)
+            return stdout
+        # The output is parsed as it is read, it is never held in full
+        writer = threading.Thread(target=self._write, args=(proc, stdin))
+        writer.daemon = True
+        writer.start()
+        while True:
+            data = proc.stdout.read1(self.chunk_size)
+            if not data:
+                break
+            parser.feed(data)
+        writer.join()
+        proc.stdout.close()
+        proc.wait()
+        return parser
+
+    def _set_limits(self, proc):
+        # Limits are set once the linter is started, setting them in the
+        # child process before the linter is started (preexec_fn) is not
+        # safe when the parent process has other threads, as the jobs
+        # threads; processes are started with a wrapper that sets the limits
+        # where they cannot be set this way
+        if not hasattr(resource, "prlimit"):  # pragma: no cover
+            return
+        for limit, values in self._limits:
+            # The linter may have finished already
+            with ignored(ProcessLookupError):
+                resource.prlimit(proc.pid, limit, values)
+
+    def _write(self, proc, stdin):
+        with ignored(OSError):
+            if stdin:
+                proc.stdin.write(stdin)
+        with ignored(OSError):
+            proc.stdin.close()
+
+    def cancel(self, future):
+        """Cancel a linter process, killing it if it is already running."""
+        if future.cancel():
+            return
+        with self._lock:
+            job = self._jobs.get(future)
+            if (job is not None) and (not future.done()):
+                job.cancelled = True
+                if job.proc is not None:
+                    self._kill(job.proc)
+
+    def cancelled(self, future):
+        """Return whether a linter process was cancelled."""
+        job = self._jobs.get(future)
+        return future.cancelled() or ((job is not None) and job.cancelled)
+
+    def close(self):
+        """Wait for linter processes, including cancelled ones, and stop."""
+        self._executor.shutdown(wait=True)
+        self._jobs = {}
+
+    def submit(self, cmd, stdin=None, parser=None, timeout=None):
+        """
+        Start a linter process.
+
+        Return a concurrent.futures.Future of the linter standard output, or
+        of the parser it was fed to if a parser is given, the process wall
+        time and the process return code. A process that does not finish
+        within timeout seconds is killed and its output is None
+        """
+        job = types.SimpleNamespace(cancelled=False, expired=False, proc=None)
+        future = self._executor.submit(
+            self._communicate, job, cmd, stdin, parser, timeout
+        )
+        with self._lock:
+            self._jobs[future] = job
+        return future
+
+
 class LintShellBuilder(Builder, metaclass=abc.ABCMeta):
     """Validate shell code in documents."""
 
     name = ""
+    # Configuration options that only affect how results are reported, or
+    # how long linting may take; scripts whose linting is cut short are
+    # linted again in the next build irrespective of them
+    report_options = (
+        "cpu_limit",
+        "fail_fast",
+        "git_base",
+        "max_findings",
+        "memory_limit",
+        "output_formats",
+        "shard",
+        "time_budget",
+        "timeout",
+    )
+    # Whether the linter reads a script from standard input when given the
+    # file name "-", otherwise scripts are written to temporary files
+    stdin_input = False
     epilog = __(
         "Look for any errors in the above output or in " "%(outdir)s/output.txt"
     )
 
-    def __init__(self, app):  # noqa
-        super(LintShellBuilder, self).__init__(app)
+    def __init__(self, app, *args, outdir=None):  # noqa
+        super(LintShellBuilder, self).__init__(app, *args)
+        if outdir is not None:
+            # Linting alongside a build of another format
+            self.outdir = outdir
+            os.makedirs(self.outdir, exist_ok=True)
         self._debug = False
-        self._col_offset = 0
+        self._build_id = "{0}-{1}".format(os.getpid(), time.time())
+        self._copies = {}
+        self._cut_off = False
+        self._deadline = None
+        self._engine = None
+        self._found = set()
         self._header = None
-        self._line_offset = 0
-        self._nodes = []
-        self._output = []
-        self._srclines = None
-        self._tabwidth = None
-        self.dialect = ""
+        self._incomplete = set()
+        self._merged = False
+        self._outbuf = []
+        self._outfile = None
+        self._nodes = {}
+        self._outstanding = collections.Counter()
+        self._over_budget = False
+        self._pending = {}
+        self._queue = collections.deque()
+        self._results = {}
+        self._scripts = {}
+        self._selected = None
+        self._stopped = False
+        self._writers = []
+        self._written = []
+        self.batch_size = 1
+        self.cache = False
+        self.cachedir = os.path.join(self.outdir, "cache")
         self.docname = ""
         self.fname = os.path.join(self.outdir, "output.txt")
-        self.source = None
+        self.git_base = ""
+        self.output_formats = []
+        self.jobs = 1
+        self.limits = []
+        self.linter_version = ""
+        self.max_findings = 0
+        self.infofname = os.path.join(self.outdir, ".buildinfo")
+        self.resultsdir = os.path.join(self.outdir, "results")
+        self.shard = None
+        self.shardfname = os.path.join(self.outdir, "shard.json")
+        self.stats = BuildStats()
+        self.statsfname = os.path.join(self.outdir, self.name + "_stats.json")
+        self.time_budget = 0
+        self.timeout = 0
+        self.warnings = False
         open(self.fname, "w").close()
 
-    def _get_block_indent(self, node):
-        return _get_indent(self._srclines[node.line + 1])
+    def _cache_fname(self, task):
+        # Content-addressed: any change in the script, the linter executable
+        # or version, or the way the linter is invoked results in a different
+        # cache entry
+        key = hashlib.sha256(
+            json.dumps(
+                [
+                    CACHE_VERSION,
+                    self.linter_version,
+                    self.cmd([], task.dialect),
+                    task.dialect,
+                    task.script,
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.cachedir, key[:2], key + ".json")
 
-    def _is_shell_node(self, node):
-        return (
-            node.source
-            and (node.tagname == "literal_block")
-            and (node.attributes.get("language").lower() in self.dialects)
+    def _cache_get(self, task):
+        if self.cache:
+            with ignored(OSError, ValueError):
+                with codecs.open(self._cache_fname(task), "r", "utf-8") as fobj:
+                    task.errors = [tuple(error) for error in json.load(fobj)]
+                task.cached = True
+        return task.cached
+
+    def _cache_put(self, task):
+        if self.cache:
+            fname = self._cache_fname(task)
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            # Write to a temporary file and rename it, so that concurrent
+            # workers never read a partially written cache entry
+            fdesc, tmpname = tempfile.mkstemp(dir=os.path.dirname(fname))
+            with os.fdopen(fdesc, "w", encoding="utf-8") as fobj:
+                json.dump(task.errors, fobj)
+            os.replace(tmpname, fname)
+
+    def _complete(self):
+        # Wait for the oldest linter process, linter processes are completed
+        # in the order they were started irrespective of when they finish
+        chunk, tasks, fnames, future, stack, parser = self._queue.popleft()
+        if (
+            (future is not None)
+            and (self._deadline is not None)
+            and (not self._engine.cancelled(future))
+        ):
+            try:
+                future.result(max(0.0, self._deadline - time.perf_counter()))
+            except concurrent.futures.TimeoutError:
+                self._over_budget = True
+                self._stop()
+                # No longer queued, so not cancelled by _stop()
+                self._engine.cancel(future)
+        if (future is not None) and self._engine.cancelled(future):
+            stack.close()
+            self._cut_off = True
+            for task in chunk:
+                for copy in [task] + self._copies.pop(task.fingerprint):
+                    self._outstanding[copy.docname] -= 1
+                    self._incomplete.add(copy.docname)
+            return
+        output, seconds, returncode = (
+            future.result() if future is not None else (b"", 0.0, 0)
         )
+        with self.stats.timer("tempfile"):
+            stack.close()
+        self.stats.add("subprocess", seconds)
+        failure = None
+        if tasks and (output is None):
+            failure = (
+                "timeout",
+                __("%s did not finish in %d seconds")
+                % (self.name, self.timeout * len(tasks)),
+            )
+        elif tasks and (returncode < 0):
+            # Killed, e.g. on reaching a resource limit
+            failure = (
+                "failed",
+                __("%s was terminated by signal %d") % (self.name, -returncode),
+            )
+        elif tasks:
+            try:
+                self._parse(tasks, fnames, output, parser)
+            except ValueError:
+                failure = (
+                    "failed",
+                    __("%s output could not be parsed, exit code %d")
+                    % (self.name, returncode),
+                )
+        if failure is not None:
+            # Reported as a finding of each script, the scripts are not
+            # cached and their documents are linted again in the next build
+            self.stats.failures += 1
+            for task in tasks:
+                task.errors = [(2, 1) + failure + ("error",)]
+        else:
+            with self.stats.timer("cache"):
+                for task in tasks:
+                    self._cache_put(task)
+        # Multi-file linter runs are evenly shared by their blocks
+        for task in chunk:
+            self._outstanding[task.docname] -= 1
+            self.stats.add_block(task, 0.0 if task.cached else seconds / len(tasks))
+            self._scripts[task.fingerprint] = (task.errors, failure is not None)
+            self._count(task)
+            if failure is not None:
+                self._incomplete.add(task.docname)
+            for copy in self._copies.pop(task.fingerprint):
+                copy.errors = list(task.errors)
+                self._count(copy)
+                self._outstanding[copy.docname] -= 1
+                self.stats.add_block(copy, 0.0)
+                if failure is not None:
+                    self._incomplete.add(copy.docname)
+        if self.max_findings and (len(self._found) >= self.max_findings):
+            self._stop()
+
+    def _count(self, task):
+        # Findings are counted as they are reported, once per source file
+        # location, so that duplicates do not stop linting early
+        if self.max_findings:
+            for error in task.errors:
+                line, col, code, desc = error[:4]
+                self._found.add(
+                    (
+                        task.source,
+                        line + task.line_offset,
+                        col + task.col_offset,
+                        code,
+                        desc,
+                    )
+                )
+
+    def _drain(self, wait=False):
+        # Keep up to two linter processes per job queued, so that there is
+        # always a script ready when a linter process finishes
+        while self._queue and (
+            wait
+            or (len(self._queue) > 2 * self.jobs)
+            or (self._queue[0][3] is None)
+            or self._queue[0][3].done()
+        ):
+            self._complete()
 
-    def _get_linter_stdout(self, lines):
-        self._debug_log("<<< lines (_get_linter_stdout)", lines, ">>>")
-        with TmpFile(fpointer=lambda x: x.write(lines.encode("ascii"))) as fname:
-            self._debug_log("Auto-generated shell file", self._read_script(fname))
-            stdout, _ = subprocess.Popen(
-                self.cmd(fname), stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            ).communicate()
-            self._debug_log("STDOUT", _tostr(stdout))
-        return stdout
-
-    def _lint_block(self, node, indent):
+    def _flush(self):
+        # Lint all pending blocks and save the results of all written
+        # documents
+        for dialect in sorted(self._pending):
+            self._submit(self._pending[dialect])
+        self._pending = {}
+        self._drain(wait=True)
+        self._save_results()
+
+    def _lint_block(self, text, dialect, source, line, indent):
+        if (
+            (self._deadline is not None)
+            and (not self._stopped)
+            and (time.perf_counter() > self._deadline)
+        ):
+            self._over_budget = True
+            self._stop()
+        if self._stopped:
+            self._cut_off = True
+            self._incomplete.add(self.docname)
+            return
         # Create a shell script with all output lines commented out to be able
         # to report file line numbers correctly
+        start = time.perf_counter()
         lines = ""
         cont_line, cmd_line = False, False
-        value = node.astext()
-        code_lines = _tostr(value).split("\n")
+        code_lines = _tostr(text).split("\n")
         lmin = max(len(code_line) for code_line in code_lines)
         self._debug_log("<<< Node code (_lint_block)", code_lines, ">>>")
         for code_line in code_lines:
@@ -214,63 +1245,211 @@ class LintShellBuilder(Builder, metaclass=abc.ABCMeta):
                 cont_line, cmd_line = False, False
                 lines += (" " * lmin) + "# Output line\n"
         shebang = "#!/bin/bash\n"
-        self._line_offset = node.line
-        self._col_offset = _get_indent(lines.split("\n")[0]) + indent + 1
+        col_offset = _get_indent(lines.split("\n")[0]) + indent + 1
         lines = shebang + textwrap.dedent(lines)
         self._debug_log("<<< lines (_lint_block)", lines, ">>>")
-        self._output = []
-        self.parse_linter_output(self._get_linter_stdout(lines))
-        return self._output
+        self.stats.add("script", time.perf_counter() - start)
+        # Errors are reported in the order the blocks were found, irrespective
+        # of how they were grouped for linting
+        task = LintTask(self.docname, (source, dialect, line, col_offset), lines)
+        self._results.setdefault(self.docname, []).append(task)
+        # The same script is linted once per build; its errors are relative
+        # to the script, each copy reports them with its own offsets
+        task.fingerprint = hashlib.sha256(
+            (dialect + "\0" + lines).encode("utf-8")
+        ).digest()
+        if task.fingerprint in self._scripts:
+            self.stats.duplicates += 1
+            errors, failed = self._scripts[task.fingerprint]
+            task.errors = list(errors)
+            if failed:
+                self._incomplete.add(self.docname)
+            self._count(task)
+            self.stats.add_block(task, 0.0)
+            if self.max_findings and (len(self._found) >= self.max_findings):
+                self._stop()
+            return
+        self._outstanding[self.docname] += 1
+        if task.fingerprint in self._copies:
+            self.stats.duplicates += 1
+            self._copies[task.fingerprint].append(task)
+            return
+        self._copies[task.fingerprint] = []
+        group = self._pending.setdefault(dialect, [])
+        group.append(task)
+        if len(group) >= self.batch_size:
+            self._submit(self._pending.pop(dialect))
+        self._drain()
 
-    def _lint_errors(self, doctree):
-        for node, indent in self._shell_nodes_with_errors(doctree):
-            errors = self._lint_block(node, indent)
-            if errors:
-                yield errors
+    def _config_digest(self):
+        # Results saved by a previous build are only valid if the linter and
+        # the extension configuration are the same in the current build
+        values = sorted(
+            (name, repr(getattr(self.config, name)))
+            for name in self.config.values
+            if name.startswith(self.name + "_")
+            and (name[len(self.name) + 1 :] not in self.report_options)
+        )
+        return hashlib.sha256(
+            repr([self.linter_version, values]).encode("utf-8")
+        ).hexdigest()
 
     def _debug_log(self, *lines):  # pragma: no cover
         if self._debug:
             for line in lines:
                 LOGGER.info(line)
 
-    def _shell_nodes(self, doctree):
-        for node in doctree.traverse():
-            if self._is_shell_node(node):
-                yield node
+    def _doc_files(self, docname):
+        # Files a document and its shell code blocks come from: the document
+        # source file, the files Sphinx found the document depends on and
+        # the files its shell code blocks are in
+        ret = [self.env.doc2path(docname)]
+        ret.extend(
+            os.path.join(self.srcdir, fname)
+            for fname in self.env.dependencies.get(docname, ())
+        )
+        ret.extend(block[2] for block in _get_blocks(self.env).get(docname, []))
+        return ret
 
-    def _shell_nodes_with_errors(self, doctree):
-        regexp = re.compile("(.*):docstring of (.*)")
-        for node in self._shell_nodes(doctree):
-            self.dialect = node.attributes.get("language").lower()
-            self.source, func_abs_name = (
-                regexp.match(node.source).groups()
-                if ":docstring of " in node.source
-                else (node.source, None)
+    def _load_results(self, docname):
+        fname = self._results_fname(docname)
+        if not os.path.exists(fname):
+            return {"build": None, "hits": 0, "misses": 0, "tasks": []}
+        with codecs.open(fname, "r", "utf-8") as fobj:
+            ret = json.load(fobj)
+        tasks = []
+        for record in ret["tasks"]:
+            location = tuple(
+                record[key]
+                for key in ("source", "dialect", "line_offset", "col_offset")
             )
-            self.source = os.path.abspath(self.source.strip())
-            self._debug_log(
-                "Analyzing file " + self.source,
-                "<<< Node code",
-                _tostr(node.astext()),
-                ">>>",
+            task = LintTask(docname, location, None)
+            task.errors = [tuple(error) for error in record["errors"]]
+            tasks.append(task)
+        ret["tasks"] = tasks
+        return ret
+
+    def _parse(self, tasks, fnames, output, parser):
+        if parser is not None:
+            # Parsed as the linter output was read
+            errors = parser.close()
+            self.stats.add("parse", parser.time)
+            self._debug_log("Findings", str(errors))
+            for task, fname in zip(tasks, fnames or ["-"]):
+                task.errors = errors.get(fname, [])
+            return
+        self._debug_log("STDOUT", _tostr(output))
+        with self.stats.timer("parse"):
+            if len(tasks) == 1:
+                tasks[0].errors = self.parse_linter_output(output)
+            else:
+                errors = self.parse_batch_linter_output(output)
+                for task, fname in zip(tasks, fnames):
+                    task.errors = errors.get(fname, [])
+
+    def _results_fname(self, docname):
+        return os.path.join(self.resultsdir, docname + ".json")
+
+    def _stop(self):
+        # The maximum number of findings was reached, or the time budget was
+        # exceeded: blocks not linted yet are dropped and running linter
+        # processes are cancelled; results are only cut off if any are
+        self._stopped = True
+        for group in self._pending.values():
+            for task in group:
+                self._cut_off = True
+                for copy in [task] + self._copies.pop(task.fingerprint):
+                    self._outstanding[copy.docname] -= 1
+                    self._incomplete.add(copy.docname)
+        self._pending = {}
+        for entry in self._queue:
+            if entry[3] is not None:
+                self._engine.cancel(entry[3])
+
+    def _shutdown(self):
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+
+    def _save_results(self):
+        # Only documents with all their blocks linted have complete results
+        written, self._written = self._written, []
+        for docname in written:
+            if self._outstanding[docname]:
+                self._written.append(docname)
+                continue
+            del self._outstanding[docname]
+            tasks = self._results.pop(docname, [])
+            hits = sum(1 for task in tasks if task.cached)
+            record = {
+                "build": self._build_id,
+                "hits": hits,
+                "misses": len(tasks) - hits,
+                "tasks": [
+                    {
+                        "source": task.source,
+                        "dialect": task.dialect,
+                        "line_offset": task.line_offset,
+                        "col_offset": task.col_offset,
+                        "errors": task.errors,
+                    }
+                    for task in tasks
+                    if task.errors
+                ],
+            }
+            fname = self._results_fname(docname)
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            with codecs.open(fname, "w", "utf-8") as fobj:
+                json.dump(record, fobj)
+            if docname in self._incomplete:
+                # The errors found in cut off documents are reported, but the
+                # documents are out of date and are linted again next build
+                os.utime(fname, (0, 0))
+
+    def _submit(self, chunk):
+        # Start a linter process for the scripts of a chunk that are not in
+        # the cache, the process runs while further blocks are found
+        with self.stats.timer("cache"):
+            tasks = [task for task in chunk if not self._cache_get(task)]
+        fnames, future, stack = [], None, contextlib.ExitStack()
+        # The base class has no parser, its subclasses may
+        parser = self.output_parser()  # pylint: disable=E1128
+        self.stats.processes += int(bool(tasks))
+        if self._engine is None:
+            self._engine = LintEngine(self.jobs, self.limits)
+            if self.time_budget:
+                self._deadline = time.perf_counter() + self.time_budget
+        timeout = (self.timeout * len(tasks)) if self.timeout else None
+        if (len(tasks) == 1) and self.stdin_input:
+            self._debug_log("<<< lines (_submit)", tasks[0].script, ">>>")
+            future = self._engine.submit(
+                self.cmd("-", tasks[0].dialect),
+                tasks[0].script.encode("ascii"),
+                parser,
+                timeout,
+            )
+        elif tasks:
+            # One temporary file per script; the file names identify each
+            # script in the output of a multi-file linter run
+            with self.stats.timer("tempfile"):
+                fnames = [
+                    stack.enter_context(
+                        TmpFile(
+                            task.script,
+                            fpointer=lambda x, y: x.write(y.encode("ascii")),
+                        )
+                    )
+                    for task in tasks
+                ]
+            for fname in fnames:
+                self._debug_log("Auto-generated shell file", self._read_script(fname))
+            future = self._engine.submit(
+                self.cmd(fnames[0] if len(fnames) == 1 else fnames, tasks[0].dialect),
+                None,
+                parser,
+                timeout,
             )
-            if func_abs_name:
-                tokens = func_abs_name.split(".")
-                func_path, func_name = ".".join(tokens[:-1]), tokens[-1]
-                func_obj = __import__(func_path).__dict__[func_name]
-                node.line = func_obj.__code__.co_firstlineno + node.line + 1
-            self._read_source_file()
-            indent = self._get_block_indent(node)
-            self._debug_log("Indent: " + str(indent))
-            yield node, indent
-
-    def _read_source_file(self):
-        self._srclines = []
-        node = docutils.nodes.Node()
-        with open(self.source, "r") as obj:
-            for line in obj.readlines():
-                node.rawsource = line
-                self._srclines.append(_tostr(node.rawsource.expandtabs(self._tabwidth)))
+        self._queue.append((chunk, tasks, fnames, future, stack, parser))
 
     def _read_script(self, fname):  # pragma: no cover
         lines = []
@@ -279,23 +1458,123 @@ class LintShellBuilder(Builder, metaclass=abc.ABCMeta):
                 lines = fhandle.readlines()
         return "".join(lines)
 
-    def add_error(self, line, col, code, desc):
-        """Add shell error to list of errors."""
-        info = (
-            self.source,
-            line + self._line_offset,
-            col + self._col_offset,
-            code,
-            desc,
-        )
-        self._debug_log("info: " + str(info))
-        if info not in self._nodes:
+    def _close_output(self):
+        if self._outfile is not None:
+            self._outfile.close()
+            self._outfile = None
+        for writer in self._writers:
+            writer.close()
+        self._outbuf, self._writers = [], []
+
+    def _flush_output(self):
+        # Only whole lines of whole documents reach the file
+        if self._outbuf:
+            self._outfile.write("".join(self._outbuf))
+            self._outfile.flush()
+            self._outbuf = []
+
+    def _read_digest(self):
+        try:
+            with open(self.infofname, "r") as fobj:
+                return fobj.read().strip()
+        except OSError:
+            return ""
+
+    def _release_errors(self, sources):
+        # Release the index of errors already reported in source files
+        for source in sources:
+            self._nodes.pop(source, None)
+
+    def _select_docs(self, docnames):
+        # Documents of a list that are linted by this build. Documents
+        # without shell code blocks are never linted. A build given a git
+        # base reference only lints the documents whose source file, the
+        # files of their shell code blocks (e.g. the modules of autodoc
+        # docstrings) or the files they depend on (e.g. included files)
+        # differ from the reference. A sharded build (shard number i of n)
+        # only lints its share of those documents; the documents are
+        # assigned to the shards by number of shell code blocks, see
+        # _assign_shards, so that all the shards of a build agree on the
+        # assignment and lint about the same number of blocks
+        blocks = _get_blocks(self.env)
+        if (self.shard is None) and (not self.git_base):
+            return [docname for docname in docnames if docname in blocks]
+        if self._selected is None:
+            selected = set(self.env.found_docs) & set(blocks)
+            if self.git_base:
+                changed = _changed_files(self.git_base, self.srcdir)
+                selected = set(
+                    docname
+                    for docname in selected
+                    if any(
+                        _norm_path(fname) in changed
+                        for fname in self._doc_files(docname)
+                    )
+                )
+            if self.shard is not None:
+                shards = _assign_shards(
+                    dict(
+                        (docname, len(blocks.get(docname, []))) for docname in selected
+                    ),
+                    self.shard[1],
+                )
+                selected = set(
+                    docname
+                    for docname, num in shards.items()
+                    if num == self.shard[0] - 1
+                )
+            self._selected = selected
+        return [docname for docname in docnames if docname in self._selected]
+
+    def _write_shard(self, docnames):
+        # The documents of a shard and where their results are, for the
+        # results of all shards to be merged
+        if self.shard is None:
+            with ignored(OSError):
+                os.remove(self.shardfname)
+            return
+        with codecs.open(self.shardfname, "w", "utf-8") as fobj:
+            json.dump(
+                {
+                    "shard": list(self.shard),
+                    "docs": dict(
+                        (docname, self.env.doc2path(docname, None))
+                        for docname in docnames
+                    ),
+                    "cut_off": self._cut_off,
+                    "over_budget": self._over_budget,
+                },
+                fobj,
+                indent=1,
+                sort_keys=True,
+            )
+
+    def add_error(self, task, error):
+        """
+        Add shell error to list of errors of a linting task.
+
+        The error is a (line, column, code, description[, severity]) tuple,
+        relative to the script of the task; the severity defaults to error
+        """
+        line, col, code, desc = error[:4]
+        severity = error[4] if len(error) > 4 else "error"
+        info = (line + task.line_offset, col + task.col_offset, code, desc)
+        self._debug_log("info: " + str((task.source,) + info))
+        index = self._nodes.setdefault(task.source, set())
+        if info not in index:
             self._debug_log("Adding info")
-            self._nodes.append(info)
-            self._output.append("Line {0}, column {1} [{2}]: {3}".format(*info[1:]))
+            index.add(info)
+            task.output.append(info + (severity,))
+
+    def build(self, *args, **kwargs):  # noqa: D102
+        super(LintShellBuilder, self).build(*args, **kwargs)
+        # Sphinx returns early, without calling finish(), when no document
+        # is out of date; the errors of previous builds still need reporting
+        if not self._merged:
+            self.merge_results()
 
     @abc.abstractmethod
-    def cmd(self, fname):  # pragma: no cover
+    def cmd(self, fname, dialect):  # pragma: no cover
         """Return shell linter command."""
         return []
 
@@ -305,13 +1584,164 @@ class LintShellBuilder(Builder, metaclass=abc.ABCMeta):
         """Return shell dialects supported."""
         pass
 
+    def finish(self):
+        """
+        Lint blocks still pending and merge the results of all documents.
+
+        Documents are merged in sorted order irrespective of the order in
+        which they were linted, so that the output does not depend on the
+        number of parallel workers
+        """
+        self._flush()
+        self._shutdown()
+        self.merge_results()
+
     def get_target_uri(self, docname, typ=None):  # pragma: no cover
         """Abstract method of base class, not germane to current builder."""
         return ""
 
-    def get_outdated_docs(self):  # pragma: no cover
-        """Abstract method of base class, not germane to current builder."""
-        return self.env.found_docs
+    def get_outdated_docs(self):
+        """
+        Return documents changed since they were last linted.
+
+        Only documents with shell code blocks are considered. A document is
+        out of date when its source file or its doctree, which Sphinx
+        re-writes when any dependency of the document changes (e.g. the
+        modules of docstrings pulled in by autodoc), is newer than the saved
+        lint results of the document. Environments without shell code blocks
+        records (e.g. that of a first build) are read before any document is
+        selected, see write
+        """
+        docnames = self.env.found_docs
+        if hasattr(self.env, "shellcheck_blocks"):
+            docnames = self._select_docs(docnames)
+        for docname in docnames:
+            try:
+                target_mtime = os.path.getmtime(self._results_fname(docname))
+                source_mtime = max(
+                    os.path.getmtime(self.env.doc2path(docname)),
+                    os.path.getmtime(
+                        os.path.join(self.doctreedir, docname + ".doctree")
+                    ),
+                )
+            except OSError:
+                yield docname
+                continue
+            if source_mtime > target_mtime:
+                yield docname
+
+    def init(self):
+        """Discard saved lint results if the linter or its configuration changed."""
+        if self._read_digest() != self._config_digest():
+            shutil.rmtree(self.resultsdir, ignore_errors=True)
+
+    def lint_docs(self, docnames):
+        """
+        Lint shell code blocks of documents and wait for them to be linted.
+
+        Used to lint alongside a build of another format, which writes the
+        documents instead of this builder
+        """
+        try:
+            for docname in docnames:
+                self.write_doc(docname, None)
+            self._flush()
+        finally:
+            self._shutdown()
+
+    def merge_results(self):
+        """
+        Report the errors of all documents.
+
+        The errors are written to the output file, and to the machine-readable
+        outputs, in document order
+        """
+        start = time.perf_counter()
+        hits, misses, reported = 0, 0, 0
+        docnames = sorted(self._select_docs(self.env.found_docs))
+        # The errors of a source file have to be indexed until the last
+        # document with errors in that file (e.g. via an include) is merged
+        last_docname = {}
+        for docname in docnames:
+            for task in self._load_results(docname)["tasks"]:
+                last_docname[task.source] = docname
+        release = {}
+        for source, docname in last_docname.items():
+            release.setdefault(docname, []).append(source)
+        self._outfile = io.open(self.fname, "w", encoding="utf-8", newline="")
+        try:
+            # Findings are streamed to the machine-readable outputs as they
+            # are merged, none of them are kept in memory
+            for fmt in self.output_formats:
+                writer, attrs = WRITERS[fmt]
+                self._writers.append(
+                    writer(
+                        os.path.splitext(self.fname)[0] + "." + fmt,
+                        *[getattr(self, attr) for attr in attrs]
+                    )
+                )
+            for docname in docnames:
+                results = self._load_results(docname)
+                if results.get("build") == self._build_id:
+                    hits += results["hits"]
+                    misses += results["misses"]
+                for task in results["tasks"]:
+                    for error in task.errors:
+                        self.add_error(task, error)
+                    if self.max_findings:
+                        remaining = self.max_findings - reported
+                        self._cut_off |= len(task.output) > remaining
+                        task.output = task.output[:remaining]
+                    if task.output:
+                        self.write_errors(task)
+                    reported += len(task.output)
+                self._release_errors(release.get(docname, []))
+                self._flush_output()
+            if self._cut_off:
+                msg = __("Results cut off after %d findings") % reported
+                if self._over_budget:
+                    msg += __(", lint time budget exceeded")
+                LOGGER.info(msg)
+                self._outfile.write(msg + os.linesep)
+                self.app.statuscode = 1
+        finally:
+            self._close_output()
+        self.stats.add("output", time.perf_counter() - start)
+        if self.cache:
+            LOGGER.info(__("lint cache: %d hits, %d misses"), hits, misses)
+        # Documents are collected when read, possibly by another build
+        times = _get_times(self.env)
+        for docname in self.stats.docs:
+            for phase, seconds in zip(("traversal", "source"), times.get(docname, ())):
+                self.stats.add(phase, seconds)
+        self.stats.save(self.statsfname)
+        for line in self.stats.summary():
+            LOGGER.info(__("lint stats: %s"), line)
+        with open(self.infofname, "w") as fobj:
+            fobj.write(self._config_digest())
+        self._write_shard(docnames)
+        self._merged = True
+
+    def output_parser(self):  # pragma: no cover
+        """
+        Return a parser the linter output is fed to as it is read.
+
+        The parser has a feed method taking output chunks, a close method
+        returning the errors lists keyed by linted file name ("-" for
+        standard input) and a time attribute with its parsing time. If there
+        is no parser, the linter output is parsed once the linter finishes
+        with the parse_linter_output and parse_batch_linter_output methods
+        """
+        return None
+
+    def parse_batch_linter_output(self, stdout):  # pragma: no cover
+        """
+        Extract linter error information from STDOUT of a multi-file run.
+
+        Return a dictionary of errors lists keyed by linted file name
+        """
+        # pylint: disable=W0613
+        return {}
 
     @abc.abstractmethod
     def parse_linter_output(self, stdout):  # pragma: no cover
@@ -328,26 +1758,223 @@ class LintShellBuilder(Builder, metaclass=abc.ABCMeta):
         """Return prompt used to denote command line start."""
         pass
 
+    def write(self, build_docnames, updated_docnames, method="update"):
+        """
+        Lint shell code blocks of documents.
+
+        The blocks are collected when the documents are read, so the
+        documents doctrees do not need to be loaded
+        """
+        if (build_docnames is None) or (build_docnames == ["__all__"]):
+            build_docnames = self.env.found_docs
+        docnames = set(build_docnames)
+        if method == "update":
+            docnames |= set(updated_docnames)
+        # The documents selected when looking for outdated documents predate
+        # the reading of new and changed documents, and of their blocks
+        self._selected = None
+        docnames = sorted(self._select_docs(docnames))
+        # The ETA of each document is computed when it is about to be linted,
+        # from the number of documents linted before it
+        total = len(docnames)
+        for _, docname in status_iterator(
+            enumerate(docnames),
+            __("linting shell code... "),
+            "darkgreen",
+            total,
+            self.app.verbosity,
+            lambda item: "{0} (ETA {1})".format(
+                item[1], self.stats.eta(item[0], total)
+            ),
+        ):
+            self.write_doc(docname, None)
+
     def write_doc(self, docname, doctree):
-        """Check shell nodes."""
+        """Lint shell code blocks of a document, the doctree is not used."""
+        if self._stopped:
+            # Not linted, the document stays out of date
+            self._cut_off |= docname in _get_blocks(self.env)
+            return
         self.docname = docname
-        self._tabwidth = doctree.settings.tab_width
-        for errors in self._lint_errors(doctree):
+        for block in _get_blocks(self.env).get(docname, []):
+            self._lint_block(*block)
+        self._written.append(docname)
+        self._save_results()
+
+    def write_errors(self, task):
+        """
+        Write errors of a linting task to file.
+
+        The errors are also reported as Sphinx warnings when linting
+        alongside a build of another format, otherwise they fail the build
+        """
+        if not self.warnings:
             self.app.statuscode = 1
-            LOGGER.info(self.source)
-            self.write_entry(self.source)
-            for error in errors:
+            LOGGER.info(task.source)
+        self.write_entry(task.docname, task.source)
+        doc = self.env.doc2path(task.docname, None)
+        for line, col, code, desc, severity in task.output:
+            error = _format_error(line, col, code, desc)
+            if self.warnings:
+                location = "{0}:{1}".format(task.source, line)
+                LOGGER.warning(error, type="shellcheck", location=location)
+            else:
                 LOGGER.info(error)
-                self.write_entry(error)
-
-    def write_entry(self, error):
-        """Write error to file."""
-        with codecs.open(self.fname, "a", "utf-8") as output:
-            output.write(
-                "{0}: {1}{2}".format(
-                    self.env.doc2path(self.docname, None), error, os.linesep
-                )
+            self.write_entry(task.docname, error)
+            finding = {
+                "code": code,
+                "column": col,
+                "doc": doc,
+                "line": line,
+                "message": desc,
+                "severity": severity,
+                "source": task.source,
+            }
+            for writer in self._writers:
+                writer.write(finding)
+
+    def write_entry(self, docname, error):
+        """Write error to file, buffered until the document is complete."""
+        self._outbuf.append(
+            "{0}: {1}{2}".format(self.env.doc2path(docname, None), error, os.linesep)
+        )
+
+
+class LintTask(object):
+    """
+    Lint a shell code block.
+
+    The location of the block is a (source, dialect, line offset, column
+    offset) tuple
+    """
+
+    def __init__(self, docname, location, script):  # noqa
+        self.cached = False
+        self.docname = docname
+        self.errors = []
+        self.fingerprint = None
+        self.output = []
+        self.script = script
+        self.source, self.dialect, self.line_offset, self.col_offset = location
+
+
+class LintThread(threading.Thread):
+    """
+    Lint shell code blocks in the background.
+
+    The blocks collected when the documents were read are linted while
+    another builder writes its output, the results are merged once the
+    build finishes
+    """
+
+    def __init__(self, builder):  # noqa
+        super(LintThread, self).__init__(name="shellcheck", daemon=True)
+        self.builder = builder
+        self.exception = None
+
+    def finish(self):
+        """Wait for all blocks to be linted and report the errors found."""
+        self.join()
+        if self.exception is not None:
+            raise self.exception
+        self.builder.merge_results()
+        LOGGER.info(self.builder.epilog % {"outdir": self.builder.outdir})
+
+    def run(self):
+        """Lint the blocks of the documents changed since the last build."""
+        # Any exception is raised again when the build finishes, exceptions
+        # of threads are otherwise only printed
+        try:
+            self.builder.lint_docs(sorted(self.builder.get_outdated_docs()))
+        except Exception as exc:  # pragma: no cover # pylint: disable=W0703
+            self.exception = exc
+
+
+class SarifWriter(object):
+    """
+    Write linting findings to a SARIF log file.
+
+    Findings are written as they are produced; only the rules, one per
+    distinct error code, are kept until the file is closed
+    """
+
+    # SARIF levels of shellcheck severities
+    levels = {"error": "error", "warning": "warning", "info": "note", "style": "note"}
+
+    def __init__(self, fname, srcdir, tool, version):  # noqa
+        self._count = 0
+        self._fobj = io.open(fname, "w", encoding="utf-8", newline="\n")
+        self._rules = set()
+        self._srcdir = os.path.abspath(srcdir)
+        self._tool = tool
+        self._version = version
+        self._fobj.write(
+            '{"$schema": "https://json.schemastore.org/sarif-2.1.0.json", '
+            '"version": "2.1.0", "runs": [{"results": [\n'
+        )
+
+    def _location(self, source):
+        # Source files are relative to the documentation source directory
+        # when possible, so that locations do not depend on the build host
+        source = os.path.abspath(source)
+        if os.path.commonpath([self._srcdir, source]) == self._srcdir:
+            uri = pathlib.Path(os.path.relpath(source, self._srcdir)).as_posix()
+            return {"uri": uri, "uriBaseId": "SRCROOT"}
+        return {"uri": pathlib.Path(source).as_uri()}  # pragma: no cover
+
+    def close(self):
+        """Write the run information and close output file."""
+        rules = []
+        for rule in sorted(self._rules):
+            rules.append({"id": rule})
+            if rule.startswith("SC"):
+                rules[-1]["helpUri"] = "https://www.shellcheck.net/wiki/" + rule
+        driver = {
+            "name": self._tool,
+            "rules": rules,
+            "version": self._version,
+        }
+        root = {"SRCROOT": {"uri": pathlib.Path(self._srcdir).as_uri() + "/"}}
+        self._fobj.write(
+            '\n], "originalUriBaseIds": {0}, "tool": {1}}}]}}\n'.format(
+                json.dumps(root), json.dumps({"driver": driver})
+            )
+        )
+        self._fobj.close()
+
+    def write(self, finding):
+        """Write a finding."""
+        # Linter failures, e.g. timeouts, are not shellcheck rules
+        code = finding["code"]
+        rule = "SC{0}".format(code) if isinstance(code, int) else code
+        self._rules.add(rule)
+        if self._count:
+            self._fobj.write(",\n")
+        self._count += 1
+        self._fobj.write(
+            json.dumps(
+                {
+                    "level": self.levels.get(finding["severity"], "warning"),
+                    "locations": [
+                        {
+                            "physicalLocation": {
+                                "artifactLocation": self._location(finding["source"]),
+                                "region": {
+                                    "startColumn": finding["column"],
+                                    "startLine": finding["line"],
+                                },
+                            }
+                        }
+                    ],
+                    "message": {"text": finding["message"]},
+                    "properties": {
+                        "doc": finding["doc"],
+                        "severity": finding["severity"],
+                    },
+                    "ruleId": rule,
+                }
             )
+        )
 
 
 class ShellcheckBuilder(LintShellBuilder):
@@ -355,60 +1982,248 @@ class ShellcheckBuilder(LintShellBuilder):
 
     name = "shellcheck"
 
-    def __init__(self, app):  # noqa
-        super(ShellcheckBuilder, self).__init__(app)
-        self._debug = app.config.shellcheck_debug
-        self._dialects = app.config.shellcheck_dialects
-        self._exe = app.config.shellcheck_executable
-        self._prompt = app.config.shellcheck_prompt
+    def __init__(self, app, *args, outdir=None):  # noqa
+        super(ShellcheckBuilder, self).__init__(app, *args, outdir=outdir)
+        self._read_config(app.config)
+        self._read_limits()
+        self._read_linter()
+        # Parallel builds run as many linter processes at a time as parallel
+        # processes were requested
+        self.jobs = max(self._jobs, app.parallel)
+
+    @property
+    def dialects(self):
+        """Return shell dialects supported by linter."""
+        return self._dialects
+
+    @property
+    def prompt(self):
+        """Return character used to denote shell command prompt."""
+        return self._prompt
+
+    def _debug_error(self, line, col, code, desc):  # pragma: no cover
+        if self._debug:
+            LOGGER.info("<<< Error")
+            LOGGER.info("Line: " + str(line))
+            LOGGER.info("Column: " + str(col))
+            LOGGER.info("Code: " + str(code))
+            LOGGER.info("Description: " + desc)
+            LOGGER.info("<<<")
+
+    def _read_config(self, config):
+        self._batch_size = config.shellcheck_batch_size
+        self._cache = config.shellcheck_cache
+        self._jobs = config.shellcheck_jobs
+        self._debug = config.shellcheck_debug
+        self._dialects = config.shellcheck_dialects
+        self._exe = config.shellcheck_executable
+        self._prompt = config.shellcheck_prompt
+        self._on_build = config.shellcheck_on_build
+        self._output_formats = config.shellcheck_output_formats
+        self._fail_fast = config.shellcheck_fail_fast
+        self._max_findings = config.shellcheck_max_findings
+        self._timeout = config.shellcheck_timeout
+        self._time_budget = config.shellcheck_time_budget
+        self._cpu_limit = config.shellcheck_cpu_limit
+        self._memory_limit = config.shellcheck_memory_limit
+        self._shard = config.shellcheck_shard
+        self._git_base = config.shellcheck_git_base
         # Validate configuration options. Data type validation done by Sphinx
         try:
             self._dialects = set(_tostr(item) for item in self._dialects)
             assert all(item in ["sh", "bash", "dash", "ksh"] for item in self._dialects)
         except:
             raise InvalidShellcheckBuilderConfig(__("Invalid dialect"))
-        exe_found = which(self._exe)
-        if (not exe_found) or (exe_found and (not _check_version())):
-            raise InvalidShellcheckBuilderConfig(
-                __("Shellcheck executable not found or not new enough")
-            )
         if len(self._prompt) != 1:
             raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck prompt"))
         if self._debug not in (0, 1):
             raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck debug flag"))
         self._debug = self._debug == 1
+        if (not isinstance(self._batch_size, int)) or (self._batch_size < 1):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck batch size"))
+        if (not isinstance(self._jobs, int)) or (self._jobs < 1):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck jobs number"))
+        if self._cache not in (0, 1):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck cache flag"))
+        self.cache = self._cache == 1
+        if self._on_build not in (0, 1):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck on build flag"))
+        try:
+            self.output_formats = sorted(
+                set(_tostr(item) for item in self._output_formats)
+            )
+            assert all(item in WRITERS for item in self.output_formats)
+        except:
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck output format"))
 
-    @property
-    def dialects(self):
-        """Return shell dialects supported by linter."""
-        return self._dialects
+    def _read_limits(self):
+        # Limits of the findings reported, of the linter processes and of the
+        # documents linted
+        if (not isinstance(self._max_findings, int)) or (self._max_findings < 0):
+            raise InvalidShellcheckBuilderConfig(
+                __("Invalid shellcheck maximum number of findings")
+            )
+        if self._fail_fast not in (0, 1):
+            raise InvalidShellcheckBuilderConfig(
+                __("Invalid shellcheck fail fast flag")
+            )
+        self.max_findings = 1 if self._fail_fast == 1 else self._max_findings
+        if (not isinstance(self._timeout, int)) or (self._timeout < 0):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck timeout"))
+        self.timeout = self._timeout
+        if (not isinstance(self._time_budget, int)) or (self._time_budget < 0):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck time budget"))
+        self.time_budget = self._time_budget
+        if (not isinstance(self._cpu_limit, int)) or (self._cpu_limit < 0):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck CPU limit"))
+        if (not isinstance(self._memory_limit, int)) or (self._memory_limit < 0):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck memory limit"))
+        if (self._cpu_limit or self._memory_limit) and (resource is None):
+            raise InvalidShellcheckBuilderConfig(
+                __("Shellcheck resource limits not supported in this platform")
+            )
+        if self._cpu_limit:
+            self.limits.append((resource.RLIMIT_CPU, self._cpu_limit))
+        if self._memory_limit:
+            # In MiB
+            self.limits.append((resource.RLIMIT_AS, self._memory_limit * 1048576))
+        match = re.match(r"^(\d+)/(\d+)$", _tostr(self._shard).strip())
+        if self._shard and (
+            (not match) or (not 1 <= int(match.group(1)) <= int(match.group(2)))
+        ):
+            raise InvalidShellcheckBuilderConfig(__("Invalid shellcheck shard"))
+        self.shard = (int(match.group(1)), int(match.group(2))) if self._shard else None
+        self.git_base = _tostr(self._git_base).strip()
+        if self.git_base:
+            try:
+                _git(
+                    ["rev-parse", "--verify", self.git_base + "^{commit}"], self.srcdir
+                )
+            except OSError:
+                raise InvalidShellcheckBuilderConfig(
+                    __("Invalid shellcheck git base reference")
+                )
 
-    @property
-    def prompt(self):
-        """Return character used to denote shell command prompt."""
-        return self._prompt
+    def _read_linter(self):
+        exe_found = which(self._exe)
+        info = (
+            _get_linter_info(exe_found, os.path.join(self.outdir, "linters.json"))
+            if exe_found
+            else {}
+        )
+        self.linter_version = info.get("version", "")
+        if (not exe_found) or (not _check_version(self.linter_version)):
+            raise InvalidShellcheckBuilderConfig(
+                __("Shellcheck executable not found or not new enough")
+            )
+        # Use the linter features found when it was probed
+        self._exe = info["path"]
+        self.batch_size = self._batch_size if info["multiple_files"] else 1
+        self.stdin_input = info["stdin"]
+        self._format = "json1" if info["json1"] else "json"
+
+    def cmd(self, fname, dialect):
+        """
+        Return command that runs the linter.
 
-    def cmd(self, fname):
-        """Return command that runs the linter."""
+        :param fname: File name, or list of file names, of script(s) to lint
+        :param dialect: Shell dialect of the script(s)
+        """
+        fnames = [fname] if isinstance(fname, str) else list(fname)
         return [
             self._exe,
-            "--shell=" + self.dialect,
+            "--shell=" + dialect,
             "--color=never",
-            "--format=json",
-            fname,
-        ]
+            "--format=" + self._format,
+        ] + fnames
+
+    def output_parser(self):
+        """Return a parser the shellcheck output is fed to as it is read."""
+        return FindingsParser()
+
+    def parse_batch_linter_output(self, stdout):
+        """Extract shellcheck error information from STDOUT of a multi-file run."""
+        ret = {}
+        keys = ("file", "line", "column", "code", "message", "level")
+        for fname, line, col, code, desc, level in _errors(stdout, keys):
+            self._debug_error(line, col, code, desc)
+            ret.setdefault(fname, []).append((line, col, code, desc, level))
+        return ret
 
     def parse_linter_output(self, stdout):
         """Extract shellcheck error information from STDOUT."""
-        for line, col, code, desc in _errors(stdout):
-            if self._debug:  # pragma: no cover
-                LOGGER.info("<<< Error")
-                LOGGER.info("Line: " + str(line))
-                LOGGER.info("Column: " + str(col))
-                LOGGER.info("Code: " + str(code))
-                LOGGER.info("Description: " + desc)
-                LOGGER.info("<<<")
-            self.add_error(line, col, code, desc)
+        ret = []
+        keys = ("line", "column", "code", "message", "level")
+        for line, col, code, desc, level in _errors(stdout, keys):
+            self._debug_error(line, col, code, desc)
+            ret.append((line, col, code, desc, level))
+        return ret
+
+
+class SourceIndex(object):
+    """
+    Index of source files lines.
+
+    Each file is memory-mapped and read once, no matter how many code blocks
+    it has, line offsets are computed only up to the last line requested and
+    files are read again only if they are modified
+    """
+
+    def __init__(self, size=64):  # noqa
+        # Memory maps hold an open file descriptor, keep a bounded number
+        self._files = collections.OrderedDict()
+        self._size = size
+
+    def _get(self, fname):
+        mtime = os.path.getmtime(fname)
+        entry = self._files.pop(fname, None)
+        if entry and (entry[0] != mtime):
+            self._release(entry)
+            entry = None
+        if entry is None:
+            with open(fname, "rb") as fobj:
+                try:
+                    data = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:  # pragma: no cover
+                    # Empty files cannot be memory-mapped
+                    data = fobj.read()
+            entry = [mtime, data, [0]]
+        self._files[fname] = entry
+        while len(self._files) > self._size:
+            self._release(self._files.popitem(last=False)[1])
+        return entry
+
+    def _release(self, entry):
+        if isinstance(entry[1], mmap.mmap):
+            entry[1].close()
+
+    def close(self):
+        """Release all indexed files."""
+        while self._files:
+            self._release(self._files.popitem()[1])
+
+    def data(self, fname):
+        """Return contents of a file, valid until the next call to the index."""
+        return self._get(fname)[1]
+
+    def line(self, fname, num, tabwidth=8):
+        """
+        Return a line of a file.
+
+        :param fname: File name
+        :param num: Line number (zero-based)
+        :param tabwidth: Number of spaces a tab is expanded to
+        """
+        _, data, offsets = self._get(fname)
+        while (len(offsets) <= num + 1) and (offsets[-1] < len(data)):
+            pos = data.find(b"\n", offsets[-1])
+            offsets.append(len(data) if pos == -1 else pos + 1)
+        if num + 1 >= len(offsets):
+            raise IndexError("line number out of range")
+        line = data[offsets[num] : offsets[num + 1]].decode("utf-8")
+        if line.endswith("\r\n"):
+            line = line[:-2] + "\n"
+        return line.expandtabs(tabwidth)
 
 
 class TmpFile(object):  # pragma: no cover
@@ -458,6 +2273,111 @@ def ignored(*exceptions):  # pragma: no cover
         pass
 
 
+# Machine-readable output writers, keyed by output file extension, and the
+# builder attributes they are created with besides the output file name
+WRITERS = {
+    "jsonl": (JsonLinesWriter, ()),
+    "sarif": (SarifWriter, ("srcdir", "name", "linter_version")),
+}
+
+
+###
+# Event handlers
+###
+def _close_collector(app, _env):
+    collector = COLLECTORS.pop(app, None)
+    if collector is not None:
+        collector.close()
+
+
+def _collect_blocks(app, doctree):
+    if app not in COLLECTORS:
+        COLLECTORS[app] = BlockCollector(
+            set(_tostr(item) for item in app.config.shellcheck_dialects),
+            # Next to the doctrees, not in the output of the build, which
+            # may be published (e.g. HTML)
+            os.path.join(app.doctreedir, "shellcheck_docstrings"),
+            app.config.shellcheck_debug == 1,
+        )
+    collector = COLLECTORS[app]
+    start, source_time = time.perf_counter(), collector.source_time
+    blocks = collector.collect(doctree)
+    if blocks:
+        # Only documents with shell code blocks are indexed, the builder
+        # ignores all other documents
+        _get_blocks(app.env)[app.env.docname] = blocks
+    source_time = collector.source_time - source_time
+    _get_times(app.env)[app.env.docname] = (
+        time.perf_counter() - start - source_time,
+        source_time,
+    )
+
+
+def _finish_lint(app, exception):
+    thread = LINT_THREADS.pop(app, None)
+    if thread is not None:
+        if exception is None:
+            thread.finish()
+        else:  # pragma: no cover
+            thread.join()
+
+
+def _get_blocks(env):
+    # Shell code blocks records keyed by name of the documents that have any
+    if not hasattr(env, "shellcheck_blocks"):
+        env.shellcheck_blocks = {}
+    return env.shellcheck_blocks
+
+
+def _get_times(env):
+    # Traversal and source reading times of the documents blocks collection
+    if not hasattr(env, "shellcheck_times"):
+        env.shellcheck_times = {}
+    return env.shellcheck_times
+
+
+def _merge_blocks(_app, env, docnames, other):
+    for func in (_get_blocks, _get_times):
+        data, other_data = func(env), func(other)
+        for docname in docnames:
+            if docname in other_data:
+                data[docname] = other_data[docname]
+
+
+def _purge_blocks(_app, env, docname):
+    _get_blocks(env).pop(docname, None)
+    _get_times(env).pop(docname, None)
+
+
+def _start_lint(app, env):
+    # Lint as part of a build of another format, to a directory of the
+    # doctrees directory (e.g. _build/doctrees/shellcheck), which is not
+    # published with the output of the build even when it is in the output
+    # directory (e.g. out/.doctrees when building with sphinx-build -b html
+    # src out)
+    if (app.config.shellcheck_on_build == 0) or isinstance(
+        app.builder, LintShellBuilder
+    ):
+        return
+    tags = set(app.tags)
+    # Builders are created with the build environment as of Sphinx 5.1, it
+    # is required as of Sphinx 7
+    builder = ShellcheckBuilder(
+        app,
+        *((env,) if sphinx.version_info >= (5, 1) else ()),
+        outdir=os.path.join(app.doctreedir, "shellcheck")
+    )
+    # The tags of the builder would change the output of the actual build
+    for tag in set(app.tags) - tags:
+        app.tags.remove(tag)
+    builder.env = env
+    builder.warnings = True
+    builder.init()
+    thread = LintThread(builder)
+    LINT_THREADS[app] = thread
+    thread.start()
+
+
 ###
 # Registration
 ###
@@ -468,3 +2388,33 @@ def setup(app):
     app.add_config_value("shellcheck_executable", "shellcheck", "env")
     app.add_config_value("shellcheck_prompt", "$", "env")
     app.add_config_value("shellcheck_debug", int(0), "env")
+    app.add_config_value("shellcheck_batch_size", int(1), "env")
+    app.add_config_value("shellcheck_jobs", int(1), "env")
+    app.add_config_value("shellcheck_cache", int(1), "env")
+    app.add_config_value("shellcheck_on_build", int(0), "env")
+    app.add_config_value("shellcheck_output_formats", [], "env")
+    # Limits of the findings reported do not require reading documents again
+    app.add_config_value("shellcheck_max_findings", int(0), "")
+    app.add_config_value("shellcheck_fail_fast", int(0), "")
+    # Neither do the limits of the linter processes
+    app.add_config_value("shellcheck_timeout", int(0), "")
+    app.add_config_value("shellcheck_time_budget", int(0), "")
+    app.add_config_value("shellcheck_cpu_limit", int(0), "")
+    app.add_config_value("shellcheck_memory_limit", int(0), "")
+    app.add_config_value("shellcheck_shard", "", "")
+    app.add_config_value("shellcheck_git_base", "", "")
+    app.connect("doctree-read", _collect_blocks)
+    app.connect("env-merge-info", _merge_blocks)
+    app.connect("env-purge-doc", _purge_blocks)
+    app.connect("env-updated", _close_collector)
+    app.connect("env-updated", _start_lint)
+    app.connect("build-finished", _finish_lint)
+    return {
+        "env_version": ENV_VERSION,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -5,22 +5,72 @@
 
 # Standard library import
 from __future__ import print_function
+import json
 import os
+import pickle
 import re
+import shutil
+import subprocess
+import sys
+import time
 
 # PyPI imports
+import docutils.core
+import pytest
+from docutils import nodes
 import sphinx.cmd.build
+import sphinx.pycode
 
 # Intra-package imports
-from shellcheck import _tostr, which
+from shellcheck import (
+    LINTERS,
+    LOGGER,
+    BlockCollector,
+    DocstringIndex,
+    FindingsParser,
+    LintEngine,
+    SourceIndex,
+    _tostr,
+    main,
+    which,
+)
 
 ###
 # Global variables
 ###
-SDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "support1")
+TDIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(os.path.dirname(TDIR), "bin")
+# Copy of the support1 project the current test builds (see support_dirs)
+SDIR = os.path.join(TDIR, "support1")
 CONF_FNAME = os.path.join(SDIR, "conf.py")
 
 
+###
+# Fixtures
+###
+@pytest.fixture(autouse=True)
+def support_dirs(tmp_path, monkeypatch):
+    """Build copies of the support projects, tests can run concurrently."""
+    for dirnum in ("1", "2"):
+        sdir = str(tmp_path / ("support" + dirnum))
+        shutil.copytree(
+            os.path.join(TDIR, "support" + dirnum),
+            sdir,
+            ignore=shutil.ignore_patterns("_build", "__pycache__"),
+        )
+        # Autodoc documents the modules of the copies
+        monkeypatch.syspath_prepend(sdir)
+        sys.modules.pop("mymodule" + dirnum, None)
+    monkeypatch.setattr(sphinx.pycode.ModuleAnalyzer, "cache", {})
+    monkeypatch.setattr(sys.modules[__name__], "SDIR", str(tmp_path / "support1"))
+    monkeypatch.setattr(
+        sys.modules[__name__], "CONF_FNAME", str(tmp_path / "support1" / "conf.py")
+    )
+    yield
+    for dirnum in ("1", "2"):
+        sys.modules.pop("mymodule" + dirnum, None)
+
+
 ###
 # Helper functions
 ###
@@ -29,11 +79,13 @@ def _get_ex_msg(obj):
     return obj.value.args[0] if hasattr(obj, "value") else obj.args[0]
 
 
-def run_sphinx(extra_argv=None, dirnum="1"):
+def run_sphinx(extra_argv=None, dirnum="1", full=True, builder="shellcheck"):
     extra_argv = [] if extra_argv is None else extra_argv
-    sdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "support" + dirnum)
+    extra_argv = extra_argv + (["-a", "-E"] if full else [])
+    extra_argv = extra_argv + (["-W"] if builder == "shellcheck" else [])
+    sdir = os.path.join(os.path.dirname(SDIR), "support" + dirnum)
     dir1 = os.path.join(sdir, "_build", "doctrees")
-    dir2 = os.path.join(sdir, "_build", "shellcheck")
+    dir2 = os.path.join(sdir, "_build", builder)
     exe = which("sphinx-build")
     argv = (
         [exe]
@@ -41,11 +93,8 @@ def run_sphinx(extra_argv=None, dirnum="1"):
         + [
             "--no-color",
             "-Q",
-            "-W",
-            "-a",
-            "-E",
             "-b",
-            "shellcheck",
+            builder,
             "-d",
             dir1,
             sdir,
@@ -59,7 +108,11 @@ def run_sphinx(extra_argv=None, dirnum="1"):
         lines = _tostr(_get_ex_msg(obj))
         ret_code = 1
         return ret_code, lines
-    fname = os.path.join(dir2, "output.txt")
+    # Other builders lint to a directory of the doctrees directory
+    fname = os.path.join(
+        dir2 if builder == "shellcheck" else os.path.join(dir1, "shellcheck"),
+        "output.txt",
+    )
     lines = []
     if os.path.exists(fname):
         with open(fname, "r") as fobj:
@@ -81,6 +134,19 @@ def test_shellcheck_error():  # noqa: D202
     validate('shellcheck_executable="not_an_exe"')
     validate('shellcheck_prompt="###"')
     validate("shellcheck_debug=5")
+    validate("shellcheck_batch_size=0")
+    validate("shellcheck_jobs=0")
+    validate("shellcheck_cache=5")
+    validate("shellcheck_on_build=2")
+    validate("shellcheck_output_formats=jsonl,xml")
+    validate("shellcheck_max_findings=-1")
+    validate("shellcheck_fail_fast=2")
+    validate("shellcheck_timeout=-1")
+    validate("shellcheck_time_budget=-1")
+    validate("shellcheck_cpu_limit=-1")
+    validate("shellcheck_memory_limit=-1")
+    validate("shellcheck_shard=3/2")
+    validate("shellcheck_shard=1-2")
 
 
 def test_shellcheck():
@@ -170,3 +236,543 @@ def test_shellcheck():
     ret_code, act_lines = run_sphinx(None, "2")
     assert not ret_code
     assert not act_lines
+
+
+def test_shellcheck_batch():
+    """Test multi-file linter runs give the same output as per-block runs."""
+    ref = run_sphinx()
+    assert ref[0] == 1
+    assert run_sphinx(["-D", "shellcheck_batch_size=2"]) == ref
+    assert run_sphinx(["-D", "shellcheck_batch_size=100"]) == ref
+    assert run_sphinx(["-D", "shellcheck_batch_size=100"], "2") == (0, [])
+
+
+def test_shellcheck_jobs():
+    """Test concurrent linter runs give the same output as serial runs."""
+    ref = run_sphinx()
+    assert ref[0] == 1
+    assert run_sphinx(["-D", "shellcheck_jobs=4"]) == ref
+    argv = ["-D", "shellcheck_jobs=4", "-D", "shellcheck_batch_size=2"]
+    assert run_sphinx(argv) == ref
+    assert run_sphinx(["-D", "shellcheck_jobs=4"], "2") == (0, [])
+
+
+def test_shellcheck_parallel():
+    """Test parallel builds give the same output as serial builds."""
+    ref = run_sphinx()
+    assert ref[0] == 1
+    assert run_sphinx(["-j", "2"]) == ref
+    assert run_sphinx(["-j", "4", "-D", "shellcheck_jobs=2"]) == ref
+    assert run_sphinx(["-j", "4"], "2") == (0, [])
+
+
+def test_shellcheck_cache():
+    """Test linting results read from the cache match linter results."""
+    cache_dir = os.path.join(SDIR, "_build", "shellcheck", "cache")
+    ref = run_sphinx(["-D", "shellcheck_cache=0"])
+    assert ref[0] == 1
+    assert run_sphinx() == ref
+    assert os.listdir(cache_dir)
+    assert run_sphinx() == ref
+    assert run_sphinx(["-D", "shellcheck_batch_size=100"]) == ref
+
+
+def test_shellcheck_incremental():
+    """Test unchanged documents are not linted again."""
+    results_dir = os.path.join(SDIR, "_build", "shellcheck", "results")
+    ref = run_sphinx()
+    assert ref[0] == 1
+    mtimes = {
+        fname: os.path.getmtime(os.path.join(results_dir, fname))
+        for fname in os.listdir(results_dir)
+    }
+    assert sorted(mtimes) == ["README.json", "api.json", "index.json"]
+    assert run_sphinx(full=False) == ref
+    assert run_sphinx(full=False) == ref
+    for fname, mtime in mtimes.items():
+        assert os.path.getmtime(os.path.join(results_dir, fname)) == mtime
+    # Configuration changes invalidate saved results
+    assert run_sphinx(["-D", "shellcheck_prompt=#"], full=False) == (0, [])
+    assert run_sphinx(full=False) == ref
+    # Environments without shell code blocks records are read again
+    fname = os.path.join(SDIR, "_build", "doctrees", "environment.pickle")
+    with open(fname, "rb") as fobj:
+        env = pickle.load(fobj)
+    del env.shellcheck_blocks
+    env.version.pop("shellcheck")
+    with open(fname, "wb") as fobj:
+        pickle.dump(env, fobj)
+    assert run_sphinx(full=False) == ref
+
+
+def test_shellcheck_linter_info():
+    """Test linter information is probed and cached."""
+    fname = os.path.join(SDIR, "_build", "shellcheck", "linters.json")
+    if os.path.exists(fname):
+        os.remove(fname)
+    LINTERS.clear()
+    assert run_sphinx()[0] == 1
+    with open(fname, "r") as fobj:
+        cache = json.load(fobj)
+    assert len(cache) == 1
+    info = list(cache.values())[0]
+    assert os.path.isabs(info["path"])
+    assert info["stdin"]
+    assert info["multiple_files"]
+
+
+def test_shellcheck_on_build():
+    """Test linting alongside another builder gives the standalone output."""
+    ref = run_sphinx()
+    assert ref[0] == 1
+    ret_code, lines = run_sphinx(["-D", "shellcheck_on_build=1"], builder="html")
+    assert (ret_code, lines) == (0, ref[1])
+    assert os.path.exists(os.path.join(SDIR, "_build", "html", "index.html"))
+    # Nothing but the HTML output is published, even when the doctrees are in
+    # the output directory
+    assert not os.path.exists(os.path.join(SDIR, "_build", "html", "docstrings"))
+    out = os.path.join(SDIR, "_build", "out")
+    argv = ["-Q", "-b", "html", "-D", "shellcheck_on_build=1", SDIR, out]
+    assert sphinx.cmd.build.main(argv) == 0
+    assert "shellcheck" not in os.listdir(out)
+    with open(os.path.join(out, ".doctrees", "shellcheck", "output.txt")) as fobj:
+        assert fobj.readlines() == ref[1]
+    # Findings are Sphinx warnings, failing strict builds
+    argv = ["-D", "shellcheck_on_build=1", "-W", "--keep-going"]
+    assert run_sphinx(argv, builder="html") == (1, ref[1])
+    assert run_sphinx(["-D", "shellcheck_on_build=1"], "2", builder="html") == (0, [])
+
+
+def test_shellcheck_output_formats():
+    """Test findings written to machine-readable outputs match output.txt."""
+    out_dir = os.path.join(SDIR, "_build", "shellcheck")
+    ref = run_sphinx()
+    assert ref[0] == 1
+    argv = ["-D", "shellcheck_output_formats=jsonl,sarif"]
+    assert run_sphinx(argv) == ref
+    errors = [line for line in ref[1] if ": Line " in line]
+    with open(os.path.join(out_dir, "output.jsonl"), "r") as fobj:
+        records = [json.loads(line) for line in fobj]
+    assert len(records) == len(errors)
+    for record, error in zip(records, errors):
+        assert error == "{0}: Line {1}, column {2} [{3}]: {4}\n".format(
+            record["doc"],
+            record["line"],
+            record["column"],
+            record["code"],
+            record["message"],
+        )
+        assert record["severity"] in ("error", "warning", "info", "style")
+        assert os.path.isabs(record["source"])
+    with open(os.path.join(out_dir, "output.sarif"), "r") as fobj:
+        sarif = json.load(fobj)
+    results = sarif["runs"][0]["results"]
+    assert [result["ruleId"] for result in results] == [
+        "SC{0}".format(record["code"]) for record in records
+    ]
+    rules = sarif["runs"][0]["tool"]["driver"]["rules"]
+    assert sorted(rule["id"] for rule in rules) == sorted(
+        set(result["ruleId"] for result in results)
+    )
+    assert run_sphinx(argv, "2") == (0, [])
+    with open(
+        os.path.join(
+            SDIR, os.pardir, "support2", "_build", "shellcheck", "output.sarif"
+        )
+    ) as fobj:
+        assert json.load(fobj)["runs"][0]["results"] == []
+
+
+def test_shellcheck_stats():
+    """Test build statistics are written."""
+    fname = os.path.join(SDIR, "_build", "shellcheck", "shellcheck_stats.json")
+    assert run_sphinx(["-D", "shellcheck_cache=0"])[0] == 1
+    with open(fname, "r") as fobj:
+        stats = json.load(fobj)
+    assert sorted(stats["docs"]) == ["README", "api", "index"]
+    assert len(stats["blocks"]) == sum(doc["blocks"] for doc in stats["docs"].values())
+    # index.rst includes README.rst, its blocks are linted only once
+    assert stats["duplicates"] == stats["docs"]["index"]["blocks"] > 0
+    assert stats["processes"] == len(stats["blocks"]) - stats["duplicates"]
+    assert not any(block["cached"] for block in stats["blocks"])
+    assert stats["times"]["subprocess"] > 0
+    assert all(seconds >= 0 for seconds in stats["times"].values())
+
+
+def test_shellcheck_stub():
+    """Test linting with the stand-in linter."""
+    stub = os.path.join(BIN_DIR, "shellcheck_stub.py")
+    argv = ["-D", "shellcheck_executable=" + stub]
+    ret_code, lines = run_sphinx(argv)
+    assert ret_code == 1
+    errors = [line for line in lines if ": Line " in line]
+    assert errors
+    assert all(" [2086]: Double quote " in line for line in errors)
+    assert run_sphinx(argv + ["-D", "shellcheck_batch_size=10"]) == (ret_code, lines)
+
+
+def test_findings_parser():
+    """Test linter output is parsed incrementally in both JSON formats."""
+    desc = "Double quote \u00e9 [x], {y}"
+    findings = [
+        {
+            "file": fname,
+            "line": num,
+            "column": 2,
+            "code": 2086,
+            "level": "info",
+            "message": desc,
+        }
+        for num, fname in enumerate(["a.sh", "b.sh", "a.sh"])
+    ]
+    ref = {
+        "a.sh": [(0, 2, 2086, desc, "info"), (2, 2, 2086, desc, "info")],
+        "b.sh": [(1, 2, 2086, desc, "info")],
+    }
+    for doc, exp in [
+        (findings, ref),
+        ({"comments": findings}, ref),
+        ([], {}),
+        ({"comments": []}, {}),
+    ]:
+        data = json.dumps(doc, ensure_ascii=False, indent=1).encode("utf-8")
+        for size in (1, 7, len(data)):
+            parser = FindingsParser()
+            for num in range(0, len(data), size):
+                parser.feed(data[num : num + size])
+            assert parser.close() == exp
+    parser = FindingsParser()
+    parser.feed(b'[{"file": "a.sh"')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_block_collector(tmp_path, monkeypatch):
+    """Test blocks whose source cannot be read are skipped."""
+    warnings = []
+    monkeypatch.setattr(
+        LOGGER, "warning", lambda *args, **kwargs: warnings.append(kwargs)
+    )
+    fname = tmp_path / "source.rst"
+    fname.write_text("Title\n\n.. code-block:: bash\n\n    echo 1\n")
+    extmod = tmp_path / "extmod.so"
+    extmod.write_bytes(b"\x7fELF\x00\x00")
+    doctree = docutils.core.publish_doctree("")
+    for source, line in [
+        (str(fname), 3),
+        (str(fname), None),
+        (str(fname), 10),
+        (str(tmp_path / "missing.py") + ":docstring of missing.func", 2),
+        (str(extmod) + ":docstring of extmod.func", 2),
+    ]:
+        node = nodes.literal_block("echo 1", "echo 1", language="bash")
+        node.source, node.line = source, line
+        doctree += node
+    collector = BlockCollector(["bash"], str(tmp_path / "cache"))
+    try:
+        assert collector.collect(doctree) == [("echo 1", "bash", str(fname), 3, 4)]
+        assert [kwargs["location"].line for kwargs in warnings] == [None, 10, 2, 2]
+    finally:
+        collector.close()
+
+
+def test_docstring_index(tmp_path):
+    """Test docstrings of module objects are found without importing them."""
+    fname = tmp_path / "mymodule.py"
+    fname.write_text(
+        "\n".join(
+            [
+                '"""Module."""',
+                "import functools",
+                "",
+                "",
+                "class MyClass(object):",
+                '    """Class."""',
+                "",
+                "    def method(self):",
+                '        """Method."""',
+                "",
+                "        def nested():",
+                '            """Nested function."""',
+                "",
+                "        return nested",
+                "",
+                "",
+                "@functools.lru_cache()",
+                "def decorated():",
+                '    """',
+                "    Decorated function.",
+                '    """',
+                "",
+                "",
+                "def undocumented():",
+                "    pass",
+                "",
+            ]
+        )
+    )
+    (tmp_path / "pkg").mkdir()
+    pkg_fname = tmp_path / "pkg" / "__init__.py"
+    pkg_fname.write_text('"""Package."""\n\n\ndef func():\n    """Function."""\n')
+    cachedir = str(tmp_path / "cache")
+    for _ in range(2):
+        # Parsed, then read from the cache
+        index = DocstringIndex(SourceIndex(), cachedir)
+        for name, line in [
+            ("pkg.mymodule", 1),
+            ("mymodule", 1),
+            ("pkg.mymodule.MyClass", 6),
+            ("mymodule.MyClass", 6),
+            ("pkg.mymodule.MyClass.method", 9),
+            ("pkg.mymodule.MyClass.method.nested", 12),
+            ("pkg.mymodule.decorated", 19),
+            ("pkg.mymodule.undocumented", None),
+            ("pkg.mymodule.missing", None),
+            ("pkg.othermodule", None),
+            # Inherited methods are not in the module of the class
+            ("pkg.mymodule.MyClass.decorated", None),
+        ]:
+            assert index.line(str(fname), name) == line
+        for name, line in [
+            ("pkg", 1),
+            ("ns.pkg", 1),
+            ("pkg.func", 5),
+            ("pkg.pkg.func", None),
+            ("other.func", None),
+        ]:
+            assert index.line(str(pkg_fname), name) == line
+        assert len(os.listdir(cachedir)) == 2
+
+
+def test_lint_engine():
+    """Test linter processes run concurrently and time out."""
+    cmd = [sys.executable, "-c"]
+    script = "import sys, time; time.sleep(float(sys.argv[1])); print(sys.argv[1])"
+    engine = LintEngine(2)
+    try:
+        # Each process output is that of its future, however they finish
+        futures = [engine.submit(cmd + [script, delay]) for delay in ("1", "0", "0.5")]
+        assert futures[1].result()[0].strip() == b"0"
+        assert not futures[0].done()
+        for future, delay in zip(futures, ("1", "0", "0.5")):
+            output, seconds, returncode = future.result()
+            assert (output.strip(), returncode) == (delay.encode("ascii"), 0)
+            assert seconds >= float(delay)
+        assert (
+            engine.submit(cmd + ["print(input())"], b"stdin\n").result()[0]
+            == b"stdin\n"
+        )
+        # Processes are killed on timeouts, and cancelled when running
+        start = time.perf_counter()
+        output, _, returncode = engine.submit(cmd + [script, "30"], timeout=1).result()
+        assert (output is None) and (returncode != 0)
+        future = engine.submit(cmd + [script, "30"])
+        time.sleep(0.5)
+        engine.cancel(future)
+        assert engine.cancelled(future)
+    finally:
+        engine.close()
+    assert time.perf_counter() - start < 20
+
+
+def test_lint_engine_limits(monkeypatch):
+    """Test linter processes are given resource limits."""
+    resource = pytest.importorskip("resource")
+    cmd = [sys.executable, "-c"]
+    # The limits are set once the process is started, where possible
+    script = (
+        "import resource, time; time.sleep(0.5); "
+        "print(resource.getrlimit(resource.RLIMIT_CPU))"
+    )
+    for prlimit in (True, False):
+        if not prlimit:
+            # Processes are started with a wrapper that sets the limits
+            monkeypatch.delattr(resource, "prlimit", raising=False)
+        engine = LintEngine(1, [(resource.RLIMIT_CPU, 100)])
+        try:
+            output, _, returncode = engine.submit(cmd + [script]).result()
+        finally:
+            engine.close()
+        assert (output.strip(), returncode) == (b"(100, 100)", 0)
+
+
+def test_source_index(tmp_path):
+    """Test source file lines are indexed until the files are modified."""
+    fname = tmp_path / "source.rst"
+    fname.write_bytes(b"line 1\r\n\tline 2\n")
+    srcindex = SourceIndex(size=1)
+    try:
+        assert srcindex.line(str(fname), 0) == "line 1\n"
+        assert srcindex.line(str(fname), 1, tabwidth=4) == "    line 2\n"
+        with pytest.raises(IndexError):
+            srcindex.line(str(fname), 2)
+        # Modified files are read again
+        mtime = os.path.getmtime(str(fname))
+        fname.write_bytes(b"new line 1\n")
+        os.utime(str(fname), (mtime + 10, mtime + 10))
+        assert srcindex.line(str(fname), 0) == "new line 1\n"
+        with pytest.raises(IndexError):
+            srcindex.line(str(fname), 1)
+        # Files evicted from the index are read again
+        other = tmp_path / "other.rst"
+        other.write_bytes(b"other\n")
+        assert srcindex.line(str(other), 0) == "other\n"
+        assert srcindex.line(str(fname), 0) == "new line 1\n"
+    finally:
+        srcindex.close()
+
+
+def test_shellcheck_max_findings():
+    """Test linting stops once the maximum number of findings is reached."""
+    ref = run_sphinx()
+    assert ref[0] == 1
+    errors = [line for line in ref[1] if ": Line " in line]
+    for argv, num in [
+        (["-D", "shellcheck_fail_fast=1"], 1),
+        (["-D", "shellcheck_max_findings=2"], 2),
+        (["-D", "shellcheck_max_findings=2", "-D", "shellcheck_jobs=4"], 2),
+    ]:
+        ret_code, lines = run_sphinx(argv)
+        assert ret_code == 1
+        assert [line for line in lines if ": Line " in line] == errors[:num]
+        assert lines[-1] == "Results cut off after {0} findings\n".format(num)
+    argv = ["-D", "shellcheck_max_findings=100"]
+    assert run_sphinx(argv) == ref
+    # Findings reported once are counted once, even if found in several
+    # documents (index.rst includes README.rst)
+    argv = ["-D", "shellcheck_max_findings={0}".format(len(errors) + 1)]
+    argv += ["-D", "shellcheck_cache=0"]
+    assert run_sphinx(argv) == ref
+    assert run_sphinx(argv + ["-D", "shellcheck_jobs=4"]) == ref
+    # Cut off documents are linted again
+    run_sphinx(["-D", "shellcheck_fail_fast=1"])
+    assert run_sphinx(full=False) == ref
+
+
+def test_shellcheck_timeout(monkeypatch):
+    """Test linters are stopped on timeouts and resource limits."""
+    stub = os.path.join(BIN_DIR, "shellcheck_stub.py")
+    argv = ["-D", "shellcheck_executable=" + stub]
+    argv += ["-D", "shellcheck_jobs=8", "-D", "shellcheck_cache=0"]
+    monkeypatch.setenv("SHELLCHECK_STUB_LATENCY", "5")
+    ret_code, lines = run_sphinx(argv + ["-D", "shellcheck_timeout=1"])
+    assert ret_code == 1
+    errors = [line for line in lines if ": Line " in line]
+    assert errors
+    assert all(
+        line.endswith(" [timeout]: shellcheck did not finish in 1 seconds\n")
+        for line in errors
+    )
+    # Timed out documents are linted again
+    monkeypatch.delenv("SHELLCHECK_STUB_LATENCY")
+    ret = run_sphinx(argv, full=False)
+    assert ret == run_sphinx(argv)
+    # Linter processes still running when the time budget runs out are killed
+    monkeypatch.setenv("SHELLCHECK_STUB_LATENCY", "60")
+    start = time.perf_counter()
+    ret_code, lines = run_sphinx(argv + ["-D", "shellcheck_time_budget=1"])
+    assert time.perf_counter() - start < 30
+    assert ret_code == 1
+    assert lines == ["Results cut off after 0 findings, lint time budget exceeded\n"]
+    monkeypatch.delenv("SHELLCHECK_STUB_LATENCY")
+    ret_code, lines = run_sphinx(argv[2:] + ["-D", "shellcheck_memory_limit=1"])
+    assert ret_code == 1
+    errors = [line for line in lines if ": Line " in line]
+    assert errors
+    assert all(" [failed]: shellcheck " in line for line in errors)
+
+
+def test_shellcheck_shard(tmp_path):
+    """Test sharded builds and the merge of their results."""
+    ref = run_sphinx()
+    assert ref[0] == 1
+    outdir = os.path.join(SDIR, "_build", "shellcheck")
+    shard_dirs = [str(tmp_path / "shard1"), str(tmp_path / "shard2")]
+    linted = []
+    for num, sdir in enumerate(shard_dirs, 1):
+        # Shards are fresh builds, documents are selected once they are read
+        shutil.rmtree(os.path.join(SDIR, "_build"))
+        argv = ["-D", "shellcheck_shard={0}/2".format(num)]
+        ret_code, lines = run_sphinx(argv, full=False)
+        assert ret_code == int(bool(lines))
+        with open(os.path.join(outdir, "shard.json"), "r") as fobj:
+            linted.append(sorted(json.load(fobj)["docs"]))
+        shutil.copytree(outdir, sdir)
+    assert linted == [["README", "index"], ["api"]]
+    merged = str(tmp_path / "merged")
+    assert main(["-o", merged] + shard_dirs) == ref[0]
+    with open(os.path.join(merged, "output.txt"), "r") as fobj:
+        assert fobj.readlines() == ref[1]
+    assert main(["-o", merged] + shard_dirs[:1]) == 2
+    # Missing results are not merged as documents without errors
+    os.remove(os.path.join(shard_dirs[1], "results", "api.json"))
+    assert main(["-o", merged] + shard_dirs) == 2
+    # Unsharded builds do not leave shard information behind
+    assert run_sphinx() == ref
+    assert not os.path.exists(os.path.join(outdir, "shard.json"))
+    # New documents are assigned to a shard in incremental builds
+    with open(os.path.join(SDIR, "new.rst"), "w") as fobj:
+        fobj.write(":orphan:\n\n.. code-block:: bash\n\n    $ echo $1\n")
+    linted = []
+    for num in (1, 2):
+        run_sphinx(["-D", "shellcheck_shard={0}/2".format(num)], full=False)
+        with open(os.path.join(outdir, "shard.json"), "r") as fobj:
+            linted.extend(json.load(fobj)["docs"])
+    assert sorted(linted) == ["README", "api", "index", "new"]
+
+
+def test_shellcheck_git_base():
+    """Test only documents changed since a git reference are linted."""
+    if not which("git"):
+        pytest.skip("git not found")
+
+    def git(*args):
+        subprocess.check_call(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+            + list(args),
+            cwd=SDIR,
+            stdout=subprocess.DEVNULL,
+        )
+
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-q", "-m", "Support project")
+    ref = run_sphinx()
+    assert ref[0] == 1
+    assert run_sphinx(["-D", "shellcheck_git_base=not_a_ref"]) == (2, [])
+    argv = ["-D", "shellcheck_git_base=HEAD"]
+    assert run_sphinx(argv) == (0, [])
+    # Autodoc modules and included files count as document sources
+    for fname, doc in [("mymodule1.py", "api.rst"), ("README.rst", "README.rst")]:
+        with open(os.path.join(SDIR, fname), "a") as fobj:
+            fobj.write("\n")
+        # Documents are selected once they are read, in fresh builds too
+        shutil.rmtree(os.path.join(SDIR, "_build"))
+        ret_code, lines = run_sphinx(argv, full=False)
+        git("checkout", "-q", "--", fname)
+        assert ret_code == 1
+        docs = set(line.split(":")[0] for line in lines)
+        assert docs & set(["README.rst", "api.rst"]) == set([doc])
+        assert [line for line in lines if line.startswith(doc + ":")] == [
+            line for line in ref[1] if line.startswith(doc + ":")
+        ]
+    # New documents are linted in incremental builds
+    assert run_sphinx(argv, full=False) == (0, [])
+    with open(os.path.join(SDIR, "new.rst"), "w") as fobj:
+        fobj.write(":orphan:\n\n.. code-block:: bash\n\n    $ echo $1\n")
+    ret_code, lines = run_sphinx(argv, full=False)
+    assert ret_code == 1
+    assert set(line.split(":")[0] for line in lines) == set(["new.rst"])
+
+
+def test_shellcheck_shell_docs():
+    """Test documents without shell code blocks are not linted."""
+    results_dir = os.path.join(SDIR, "_build", "shellcheck", "results")
+    assert run_sphinx(["-D", "shellcheck_dialects=ksh"]) == (0, [])
+    assert not os.path.exists(results_dir)
+    fname = os.path.join(SDIR, "_build", "doctrees", "environment.pickle")
+    with open(fname, "rb") as fobj:
+        env = pickle.load(fobj)
+    assert env.shellcheck_blocks == {}
+    assert run_sphinx()[0] == 1
+    assert sorted(os.listdir(results_dir)) == ["README.json", "api.json", "index.json"]